@@ -1,16 +1,50 @@
 import os
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 from langgraph.store.postgres.aio import AsyncPostgresStore
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 
-from app.config import DB_URL
+from app.config import (
+    DB_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE, DB_POOL_MAX_LIFETIME,
+)
 
 DB_URI = DB_URL
 
+
+def create_pool():
+    """One pool for the checkpointer and the store, so concurrent chats are not
+    serialized on a single connection each."""
+    return AsyncConnectionPool(
+        DB_URI,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_idle=DB_POOL_MAX_IDLE,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        # Connection settings LangGraph's Postgres checkpointer and store require
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        check=AsyncConnectionPool.check_connection,
+        name="langgraph",
+        open=False,
+    )
+
+
 async def init_memory():
-    store_ctx = AsyncPostgresStore.from_conn_string(DB_URI)
-    checkpointer_ctx = AsyncPostgresSaver.from_conn_string(DB_URI)
+    pool = create_pool()
+    await pool.open(wait=True)
+
+    store = AsyncPostgresStore(pool)
+    checkpointer = AsyncPostgresSaver(pool)
+
+    return store, checkpointer, pool
 
-    store = await store_ctx.__aenter__()
-    checkpointer = await checkpointer_ctx.__aenter__()
 
-    return store, checkpointer, store_ctx, checkpointer_ctx
+def pool_stats(pool):
+    """Size and saturation of the pool, plus psycopg_pool's request counters."""
+    stats = pool.get_stats()
+    in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+    return {
+        **stats,
+        "in_use": in_use,
+        "saturation": in_use / pool.max_size if pool.max_size else 0.0,
+    }
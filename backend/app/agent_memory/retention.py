@@ -0,0 +1,247 @@
+"""Checkpoint retention for the LangGraph Postgres checkpointer.
+
+Every superstep of a chat writes a checkpoint and nothing ever removes them.
+This job keeps the latest `keep` checkpoints of every thread and deletes the
+older ones, their pending writes and the channel blobs no remaining
+checkpoint refers to. Chat history is served from the chat_messages
+transcript, so only the latest checkpoint is needed to continue a chat;
+the others are kept for debugging and time travel.
+
+Threads are compacted `batch_size` at a time, one short transaction per
+batch, with a lock timeout so a batch that would wait on a running chat is
+skipped until the next run instead of stalling it. A pass holds a session
+advisory lock, so with several workers only one of them compacts at a time;
+the others skip their pass.
+
+    python -m app.agent_memory.retention --keep 10 --batch-size 50
+"""
+import sys
+import random
+import asyncio
+import argparse
+from datetime import datetime, timezone
+
+from psycopg import errors
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from app.config import (
+    CHECKPOINT_KEEP, CHECKPOINT_RETENTION_BATCH, CHECKPOINT_RETENTION_INTERVAL, CHECKPOINT_LOCK_TIMEOUT,
+    CHECKPOINT_RETENTION_DELAY, CHECKPOINT_RETENTION_JITTER,
+)
+
+TABLES = ("checkpoints", "checkpoint_writes", "checkpoint_blobs")
+
+SELECT_THREADS_SQL = """
+SELECT DISTINCT thread_id FROM checkpoints
+WHERE thread_id > %(after)s
+ORDER BY thread_id
+LIMIT %(limit)s
+"""
+
+# Checkpoint ids are time-ordered (uuid6), the order the checkpointer lists them in
+DELETE_CHECKPOINTS_SQL = """
+WITH ranked AS (
+    SELECT thread_id, checkpoint_ns, checkpoint_id,
+           row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rank
+    FROM checkpoints
+    WHERE thread_id = ANY(%(threads)s)
+), deleted AS (
+    DELETE FROM checkpoints c
+    USING ranked r
+    WHERE r.rank > %(keep)s
+      AND c.thread_id = r.thread_id AND c.checkpoint_ns = r.checkpoint_ns AND c.checkpoint_id = r.checkpoint_id
+    RETURNING c.thread_id, c.checkpoint_ns, c.checkpoint_id,
+              pg_column_size(c.checkpoint) + pg_column_size(c.metadata) AS bytes
+), deleted_writes AS (
+    DELETE FROM checkpoint_writes w
+    USING deleted d
+    WHERE w.thread_id = d.thread_id AND w.checkpoint_ns = d.checkpoint_ns AND w.checkpoint_id = d.checkpoint_id
+    RETURNING pg_column_size(w.blob) AS bytes
+)
+SELECT
+    (SELECT count(*) FROM deleted) AS checkpoints,
+    (SELECT coalesce(sum(bytes), 0) FROM deleted) AS checkpoint_bytes,
+    (SELECT count(*) FROM deleted_writes) AS writes,
+    (SELECT coalesce(sum(bytes), 0) FROM deleted_writes) AS write_bytes
+"""
+
+# A blob is unreferenced when no remaining checkpoint of its thread lists its
+# channel version. Blobs are written before their checkpoint row, so only
+# versions older than one a checkpoint already refers to are deleted; the
+# blobs of a checkpoint being written right now are newer than that.
+DELETE_BLOBS_SQL = """
+WITH referenced AS (
+    SELECT c.thread_id, c.checkpoint_ns, v.key AS channel, v.value AS version
+    FROM checkpoints c, jsonb_each_text(c.checkpoint -> 'channel_versions') v
+    WHERE c.thread_id = ANY(%(threads)s)
+), deleted AS (
+    DELETE FROM checkpoint_blobs b
+    WHERE b.thread_id = ANY(%(threads)s)
+      AND NOT EXISTS (
+        SELECT 1 FROM referenced r
+        WHERE r.thread_id = b.thread_id AND r.checkpoint_ns = b.checkpoint_ns
+          AND r.channel = b.channel AND r.version = b.version
+      )
+      AND b.version < (
+        SELECT max(r.version) FROM referenced r
+        WHERE r.thread_id = b.thread_id AND r.checkpoint_ns = b.checkpoint_ns AND r.channel = b.channel
+      )
+    RETURNING coalesce(octet_length(b.blob), 0) AS bytes
+)
+SELECT count(*) AS blobs, coalesce(sum(bytes), 0) AS blob_bytes FROM deleted
+"""
+
+TABLE_BYTES_SQL = "SELECT pg_total_relation_size(%s::regclass) AS bytes"
+
+LOCK_NAME = "checkpoint_retention"
+TRY_LOCK_SQL = "SELECT pg_try_advisory_lock(hashtext(%s)) AS locked"
+UNLOCK_SQL = "SELECT pg_advisory_unlock(hashtext(%s))"
+
+last_report = None
+
+
+async def table_bytes(conn):
+    sizes = {}
+    for table in TABLES:
+        cursor = await conn.execute(TABLE_BYTES_SQL, (table,))
+        sizes[table] = (await cursor.fetchone())["bytes"]
+    return sizes
+
+
+async def compact_batch(conn, threads, keep, lock_timeout):
+    """Delete the old checkpoints, writes and blobs of some threads in one transaction."""
+    async with conn.transaction():
+        await conn.execute(
+            "SELECT set_config('lock_timeout', %s, true), set_config('statement_timeout', '60s', true)",
+            (lock_timeout,),
+        )
+        params = {"threads": threads, "keep": keep}
+        deleted = await (await conn.execute(DELETE_CHECKPOINTS_SQL, params)).fetchone()
+        blobs = await (await conn.execute(DELETE_BLOBS_SQL, params)).fetchone()
+    return {**deleted, **blobs}
+
+
+async def compact_checkpoints(pool, keep=CHECKPOINT_KEEP, batch_size=CHECKPOINT_RETENTION_BATCH,
+                              lock_timeout=CHECKPOINT_LOCK_TIMEOUT, pause=0.1):
+    """Run one retention pass over every thread and return what it deleted.
+
+    Returns None without touching anything when another process holds the
+    retention lock. `*_bytes` count the deleted column data; the space is
+    reused by Postgres after autovacuum, so the table sizes only shrink with
+    a VACUUM FULL.
+    """
+    # Session lock, held on its own connection for the whole pass
+    async with pool.connection() as lock_conn:
+        locked = (await (await lock_conn.execute(TRY_LOCK_SQL, (LOCK_NAME,))).fetchone())["locked"]
+        if not locked:
+            return None
+        try:
+            return await _compact_checkpoints(pool, keep, batch_size, lock_timeout, pause)
+        finally:
+            await lock_conn.execute(UNLOCK_SQL, (LOCK_NAME,))
+
+
+async def _compact_checkpoints(pool, keep, batch_size, lock_timeout, pause):
+    global last_report
+    keep = max(keep, 1)  # the latest checkpoint is what the next turn resumes from
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "keep": keep,
+        "threads": 0,
+        "batches": 0,
+        "skipped_batches": 0,
+        "checkpoints": 0,
+        "writes": 0,
+        "blobs": 0,
+        "reclaimed_bytes": 0,
+    }
+    async with pool.connection() as conn:
+        report["table_bytes_before"] = await table_bytes(conn)
+
+    after = ""
+    while True:
+        async with pool.connection() as conn:
+            rows = await (await conn.execute(SELECT_THREADS_SQL, {"after": after, "limit": batch_size})).fetchall()
+            if not rows:
+                break
+            threads = [row["thread_id"] for row in rows]
+            after = threads[-1]
+            try:
+                deleted = await compact_batch(conn, threads, keep, lock_timeout)
+            except (errors.LockNotAvailable, errors.QueryCanceled) as e:
+                report["skipped_batches"] += 1
+                print(f"Checkpoint retention skipped {len(threads)} threads: {e}")
+                deleted = None
+        if deleted is None:
+            await asyncio.sleep(pause)
+            continue
+        report["threads"] += len(threads)
+        report["batches"] += 1
+        report["checkpoints"] += deleted["checkpoints"]
+        report["writes"] += deleted["writes"]
+        report["blobs"] += deleted["blobs"]
+        report["reclaimed_bytes"] += deleted["checkpoint_bytes"] + deleted["write_bytes"] + deleted["blob_bytes"]
+        # Leave the pool to the chats between batches
+        await asyncio.sleep(pause)
+
+    async with pool.connection() as conn:
+        report["table_bytes_after"] = await table_bytes(conn)
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    last_report = report
+    return report
+
+
+async def run_retention(pool, interval=CHECKPOINT_RETENTION_INTERVAL,
+                        delay=CHECKPOINT_RETENTION_DELAY, jitter=CHECKPOINT_RETENTION_JITTER):
+    """Lifespan task: a retention pass `delay` seconds after startup, then every `interval` seconds.
+
+    Every wait gets up to `jitter` random seconds, so the workers of a
+    deployment do not all try at once.
+    """
+    await asyncio.sleep(delay + random.uniform(0, jitter))
+    while True:
+        try:
+            report = await compact_checkpoints(pool)
+            if report is None:
+                print("Checkpoint retention is running in another process, skipping this pass.")
+            else:
+                print(
+                    f"Checkpoint retention deleted {report['checkpoints']} checkpoints, {report['writes']} writes "
+                    f"and {report['blobs']} blobs ({report['reclaimed_bytes']} bytes)"
+                )
+        except Exception as e:
+            print(f"Checkpoint retention failed: {e}")
+        await asyncio.sleep(interval + random.uniform(0, jitter))
+
+
+def stats():
+    return last_report
+
+
+async def _main(args):
+    from .db import DB_URI
+
+    async with AsyncConnectionPool(
+        # The retention lock and the batches each hold a connection
+        DB_URI, min_size=1, max_size=2, open=False,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+    ) as pool:
+        report = await compact_checkpoints(pool, keep=args.keep, batch_size=args.batch_size, lock_timeout=args.lock_timeout)
+    if report is None:
+        print("Checkpoint retention is already running in another process.")
+        return
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep", type=int, default=CHECKPOINT_KEEP, help="checkpoints kept per thread")
+    parser.add_argument("--batch-size", type=int, default=CHECKPOINT_RETENTION_BATCH, help="threads per transaction")
+    parser.add_argument("--lock-timeout", default=CHECKPOINT_LOCK_TIMEOUT, help="e.g. 2s; batches waiting longer are skipped")
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
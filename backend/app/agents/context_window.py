@@ -0,0 +1,78 @@
+import json
+
+from langchain.schema import HumanMessage
+
+from app.config import CONTEXT_WINDOW_TOKENS, CONTEXT_WINDOW_MAX_TOKENS
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken missing, or its encoding files cannot be fetched
+    _encoding = None
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+
+def count_text_tokens(text):
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+def count_tokens(message):
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tokens = MESSAGE_OVERHEAD + count_text_tokens(content)
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += count_text_tokens(call["name"] + json.dumps(call["args"]))
+    return tokens
+
+
+def count_new_messages(state):
+    """Token count of every message, reusing the counts already in state.
+
+    Only messages added since the last run are tokenized; counts of removed
+    messages are dropped.
+    """
+    known = state.get("token_counts") or {}
+    return {"token_counts": {
+        message.id: known[message.id] if message.id in known else count_tokens(message)
+        for message in state["messages"]
+    }}
+
+def total_tokens(state):
+    counts = state.get("token_counts") or {}
+    return sum(counts.get(message.id) or count_tokens(message) for message in state["messages"])
+
+
+def context_window(state, budget=CONTEXT_WINDOW_TOKENS, max_tokens=CONTEXT_WINDOW_MAX_TOKENS):
+    """The most recent messages that fit the token budget, starting at a user message.
+
+    Starting at a HumanMessage keeps tool results together with the call that
+    requested them. The latest user turn is always kept, even when it alone
+    exceeds the budget. Messages the summary does not cover yet (after
+    summary_cursor) are kept too, since summarization starts below the budget,
+    but only up to max_tokens: a missing, pending or failing summary cannot
+    send the whole history to the supervisor.
+    """
+    messages = state["messages"]
+    counts = state.get("token_counts") or {}
+
+    ids = [m.id for m in messages]
+    cursor = state.get("summary_cursor")
+    unsummarized = ids.index(cursor) + 1 if cursor in ids else 0
+
+    start = capped = len(messages)
+    used = 0
+    for i in range(len(messages) - 1, -1, -1):
+        used += counts.get(messages[i].id) or count_tokens(messages[i])
+        if used > max_tokens:
+            break
+        capped = i
+        if used <= budget:
+            start = i
+
+    start = max(min(start, unsummarized), capped)
+    human = next((i for i in range(start, len(messages)) if isinstance(messages[i], HumanMessage)), None)
+    if human is None:
+        human = next((i for i in range(start - 1, -1, -1) if isinstance(messages[i], HumanMessage)), 0)
+    return messages[human:]
@@ -1,11 +1,13 @@
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from typing import List, Dict
-from app.model.chatmodel import llm
+from app.model.chatmodel import get_llm
+from app.store.response_cache import response_cache
 
+llm = get_llm("diagnosis")
 
 
-@tool
-def diagnose_condition(symptoms: List[str], follow_up_qna: List[Dict[str, str]], user_profile:str) -> str:
+
+def _diagnose_condition(symptoms: List[str], follow_up_qna: List[Dict[str, str]], user_profile:str) -> str:
     """
     Provide a possible diagnosis based on user-reported symptoms and follow-up question-answer pairs.
 
@@ -31,6 +33,14 @@ def diagnose_condition(symptoms: List[str], follow_up_qna: List[Dict[str, str]],
         str: 
             A string describing the possible diagnosis based on the given input.
     """
+    return response_cache.call("diagnose_condition", diagnosis_prompt, llm, symptoms=symptoms, follow_up_qna=follow_up_qna, user_profile=user_profile)
+
+
+async def _adiagnose_condition(symptoms: List[str], follow_up_qna: List[Dict[str, str]], user_profile:str) -> str:
+    return await response_cache.acall("diagnose_condition", diagnosis_prompt, llm, symptoms=symptoms, follow_up_qna=follow_up_qna, user_profile=user_profile)
+
+
+def diagnosis_prompt(symptoms, follow_up_qna, user_profile):
     formatted_qna = "\n".join(
         f"Q: {item['question']}\nA: {item['answer']}" for item in follow_up_qna
     )
@@ -51,6 +61,13 @@ def diagnose_condition(symptoms: List[str], follow_up_qna: List[Dict[str, str]],
 
     Diagnosis:
     """
+    return prompt
+
+
+response_cache.register("diagnose_condition", diagnosis_prompt)
 
-    response = llm.invoke(prompt)
-    return response
\ No newline at end of file
+diagnose_condition = StructuredTool.from_function(
+    func=_diagnose_condition,
+    coroutine=_adiagnose_condition,
+    name="diagnose_condition",
+)
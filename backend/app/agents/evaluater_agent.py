@@ -1,9 +1,21 @@
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
 from typing import List
-from app.model.chatmodel import llm
+from app.model.chatmodel import get_llm
+from app.agents.relevance_gate import relevance_gate
 
-@tool
-def check_documents(symptoms: List[str], documents: List[str]) -> str:
+llm = get_llm("evaluator")
+
+evaluation_prompt = """
+    You are a medical assistant. Based on the following symptoms and retrieved documents, determine which documents are relevant to the symptoms.
+    If they are relevant return only the relevant documents.
+    If they are not relevant then answer no relevant documents found.
+    No other answers are allowed.
+    Symptoms: {symptoms}
+    Documents: {documents}
+    """
+
+def _check_documents(symptoms: List[str], documents: List[str]) -> str:
     """
     Check that if retrieved documents are relevant  based on the user's symptoms.
 
@@ -14,15 +26,57 @@ def check_documents(symptoms: List[str], documents: List[str]) -> str:
     Returns:
         str: documents or string saying no relevant document found
     """
+    response = llm.invoke(evaluation_prompt.format(symptoms=symptoms, documents=documents))
+    relevance_gate.record_evaluation(symptoms, documents, response.content)
+    return response.content
 
-    prompt = """
-    You are a medical assistant. Based on the following symptoms and retrieved documents, determine which documents are relevant to the symptoms.
-    If they are relevant return only the relevant documents.
-    If they are not relevant then answer no relevant documents found.
-    No other answers are allowed.
+
+async def _acheck_documents(symptoms: List[str], documents: List[str]) -> str:
+    response = await llm.ainvoke(evaluation_prompt.format(symptoms=symptoms, documents=documents))
+    relevance_gate.record_evaluation(symptoms, documents, response.content)
+    return response.content
+
+
+check_documents = StructuredTool.from_function(
+    func=_check_documents,
+    coroutine=_acheck_documents,
+    name="check_documents",
+)
+
+class DocumentVerdict(BaseModel):
+    """Which of the numbered documents are relevant to the symptoms."""
+    relevant_documents: List[int] = Field(
+        default_factory=list,
+        description="Numbers of the relevant documents; empty when none of them is relevant",
+    )
+
+verdict_prompt = """
+    You are a medical assistant. Based on the following symptoms and the numbered retrieved documents,
+    determine which documents are relevant to the symptoms.
+    Answer with the numbers of the relevant documents, or an empty list if none of them is relevant.
     Symptoms: {symptoms}
-    Documents: {documents}
+    Documents:
+    {documents}
     """
 
-    response = llm.invoke(prompt.format(symptoms=symptoms, documents=documents))
-    return response
\ No newline at end of file
+verdict_llm = llm.with_structured_output(DocumentVerdict)
+
+
+def verdict_request(symptoms, documents):
+    numbered = "\n".join(f"[{i}] {doc}" for i, doc in enumerate(documents, 1))
+    return verdict_prompt.format(symptoms=symptoms, documents=numbered)
+
+
+def verdict_indices(symptoms, documents, verdict):
+    """0-based positions of the documents the evaluator kept, ignoring numbers out of range."""
+    relevance_gate.record_evaluation(symptoms, documents, verdict.model_dump())
+    return sorted({n - 1 for n in verdict.relevant_documents if 1 <= n <= len(documents)})
+
+
+def relevant_document_indices(symptoms: List[str], documents: List[str]) -> List[int]:
+    """Structured counterpart of check_documents, used by process_symptoms."""
+    return verdict_indices(symptoms, documents, verdict_llm.invoke(verdict_request(symptoms, documents)))
+
+
+async def arelevant_document_indices(symptoms: List[str], documents: List[str]) -> List[int]:
+    return verdict_indices(symptoms, documents, await verdict_llm.ainvoke(verdict_request(symptoms, documents)))
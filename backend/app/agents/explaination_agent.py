@@ -1,11 +1,13 @@
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from typing import List, Dict
-from app.model.chatmodel import llm
+from app.model.chatmodel import get_llm
+from app.store.response_cache import response_cache
 
+llm = get_llm("explanation")
 
 
-@tool
-def explain_diagnosis(diagnosis:str, symptoms: List[str], follow_up_qna: List[Dict[str, str]], user_profile:str) -> str:
+
+def _explain_diagnosis(diagnosis:str, symptoms: List[str], follow_up_qna: List[Dict[str, str]], user_profile:str) -> str:
     """
     Provide an explanation of the user's diagnosis based on their profile.
 
@@ -26,6 +28,14 @@ def explain_diagnosis(diagnosis:str, symptoms: List[str], follow_up_qna: List[Di
         str: 
             A string containing the explanation of the diagnosis.
     """
+    return response_cache.call("explain_diagnosis", explanation_prompt, llm, diagnosis=diagnosis, symptoms=symptoms, follow_up_qna=follow_up_qna, user_profile=user_profile)
+
+
+async def _aexplain_diagnosis(diagnosis:str, symptoms: List[str], follow_up_qna: List[Dict[str, str]], user_profile:str) -> str:
+    return await response_cache.acall("explain_diagnosis", explanation_prompt, llm, diagnosis=diagnosis, symptoms=symptoms, follow_up_qna=follow_up_qna, user_profile=user_profile)
+
+
+def explanation_prompt(diagnosis, symptoms, follow_up_qna, user_profile):
     formatted_qna = "\n".join(
         f"Q: {item['question']}\nA: {item['answer']}" for item in follow_up_qna
     )
@@ -49,6 +59,13 @@ def explain_diagnosis(diagnosis:str, symptoms: List[str], follow_up_qna: List[Di
 
     Explanation:
     """
+    return prompt
+
+
+response_cache.register("explain_diagnosis", explanation_prompt)
 
-    response = llm.invoke(prompt)
-    return response
\ No newline at end of file
+explain_diagnosis = StructuredTool.from_function(
+    func=_explain_diagnosis,
+    coroutine=_aexplain_diagnosis,
+    name="explain_diagnosis",
+)
@@ -1,11 +1,21 @@
+import re
+import asyncio
+
 from langchain_core.runnables.config import RunnableConfig
-from langchain.schema import SystemMessage
+from langchain.schema import SystemMessage, HumanMessage
 
 from trustcall import create_extractor
 from langgraph.store.base import BaseStore
 
 from .supervisor_agent import ExtendedMessagesState, UserProfile
-from app.model.chatmodel import llm
+from .summary_agent import thread_lock
+from app.model.chatmodel import get_llm
+from app.store.user_profile import profile_service, format_profile
+
+llm = get_llm("memory")
+
+_extracting = set()
+_tasks = set()
 
 
 
@@ -15,29 +25,37 @@ trustcall_extractor = create_extractor(
     tool_choice="UserProfile"
 )
 
-def write_memory(state: ExtendedMessagesState, config: RunnableConfig, store: BaseStore):
+# Cheap local check for messages that may state a name, age, gender or a
+# medical condition; only these are worth a trustcall extraction
+PROFILE_HINTS = re.compile(
+    r"\b("
+    r"my name|call me|i am called|i'm called"
+    r"|years? old|\d+\s*(y/?o|yrs?)\b|my age|i am \d+|i'm \d+|aged? \d+"
+    r"|male|female|man|woman|boy|girl|gender|non-binary"
+    r"|diagnosed|diagnosis of|history of|suffer(ing)? from|living with|chronic"
+    r"|allerg\w*|asthma|diabet\w*|hypertension|blood pressure|pregnan\w*"
+    r"|my condition|conditions?|medication|i take|i'm taking|i am taking"
+    r")\b",
+    re.IGNORECASE,
+)
 
-    """Reflect on the chat history and save a memory to the store."""
 
-    
-    # Get the user ID from the config
-    user_id = config["configurable"]["user_id"]
+def mentions_profile_facts(text):
+    return bool(PROFILE_HINTS.search(text or ""))
 
-    namespace_for_memory = ("user_profile", user_id)
-    user_profile = store.get(namespace_for_memory, "user_details")
-
-    existing_profile = {"UserProfile": user_profile.value} 
-    formatted_memory = None
-    if user_profile and user_profile.value:
-        memory_dict = user_profile.value
-        formatted_memory = (
-            f"Name: {memory_dict.get('user_name', 'Unknown')}\n"
-            f"Known Medical Conditions: {', '.join(memory_dict.get('known_medical_conditions', []))}"
-            f"Age: {memory_dict.get('age', 'Unknown')}\n"
-            f"Gender: {memory_dict.get('gender', 'Unknown')}\n"
-        )
-    else:
-        formatted_memory = None
+
+def unseen_messages(state: ExtendedMessagesState):
+    """Messages after the profile cursor: those no extraction has looked at yet."""
+    messages = state["messages"]
+    cursor = state.get("profile_cursor")
+    ids = [m.id for m in messages]
+    if cursor in ids:
+        return messages[ids.index(cursor) + 1:]
+    return messages
+
+
+def extraction_request(messages, profile):
+    """trustcall input for the given messages and the existing profile it should update."""
 
     system_msg = """Update the user profile (JSON doc) to incorporate new information from the chat history
                  Always use facts provided by the user not by the AI
@@ -47,8 +65,71 @@ def write_memory(state: ExtendedMessagesState, config: RunnableConfig, store: Ba
                  Make sure conditions should be a list of medical conditions the user share and append it to the list provided if you found any new consition.
                  """
 
-    result = trustcall_extractor.invoke({"messages": [SystemMessage(content=system_msg.format(memory=formatted_memory))]+ state["messages"]}, 
-                                 {"existing": existing_profile })
-    updated_schema = result["responses"][0].model_dump_json()
+    request = {"messages": [SystemMessage(content=system_msg.format(memory=format_profile(profile)))] + messages}
+    if profile:
+        request["existing"] = {"UserProfile": profile}
+    return request
+
+
+def profile_update(state: ExtendedMessagesState):
+    """The new messages to extract from, or None when none of the user's messages hint at profile facts."""
+    messages = unseen_messages(state)
+    if not any(isinstance(m, HumanMessage) and mentions_profile_facts(m.content) for m in messages):
+        return None
+    return messages
+
+
+def write_memory(state: ExtendedMessagesState, config: RunnableConfig, store: BaseStore):
+
+    """Reflect on the new messages and save the profile to the store if it changed."""
+    user_id = config["configurable"]["user_id"]
+    messages = profile_update(state)
+    if messages:
+        profile = profile_service.get(store, user_id)
+        result = trustcall_extractor.invoke(extraction_request(messages, profile))
+        profile_service.put(store, user_id, result["responses"][0].model_dump(mode="json"))
+    return {"profile_cursor": state["messages"][-1].id}
+
+
+async def awrite_memory(state: ExtendedMessagesState, config: RunnableConfig, store: BaseStore):
+    """Async write_memory."""
+    user_id = config["configurable"]["user_id"]
+    messages = profile_update(state)
+    if messages:
+        profile = await profile_service.aget(store, user_id)
+        result = await trustcall_extractor.ainvoke(extraction_request(messages, profile))
+        await profile_service.aput(store, user_id, result["responses"][0].model_dump(mode="json"))
+    return {"profile_cursor": state["messages"][-1].id}
+
+
+async def extract_profile_in_background(graph, config):
+    """Run write_memory on a thread after its response and commit the new profile cursor."""
+    thread_id = config["configurable"]["thread_id"]
+    if thread_id in _extracting:
+        return
+    _extracting.add(thread_id)
+    try:
+        state = (await graph.aget_state(config)).values
+        if not state.get("messages"):
+            return
+        update = await awrite_memory(state, config, graph.store)
+        async with thread_lock(thread_id):
+            await graph.aupdate_state(config, update, as_node="write_memory")
+    except Exception as e:
+        print(f"Profile extraction of thread {thread_id} failed: {e}")
+    finally:
+        _extracting.discard(thread_id)
+
+
+def schedule_profile_extraction(graph, config, message):
+    """Extract profile facts after the response, but only when the user's message hints at some.
 
-    store.put(namespace_for_memory, "user_details", updated_schema)
\ No newline at end of file
+    Messages that do not are skipped without touching the checkpoint; the
+    next extraction still sees them, since the cursor has not moved.
+    """
+    if not mentions_profile_facts(message):
+        return None
+    task = asyncio.create_task(extract_profile_in_background(graph, config))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
@@ -0,0 +1,90 @@
+from langchain.schema import AIMessage, HumanMessage
+from langchain_core.messages import ToolMessage
+
+from app.agents.relevance_gate import REJECTED
+
+
+def relevant_documents(result):
+    """Documents of a process_symptoms result that the gate or the evaluator kept."""
+    if result["relevance"] == REJECTED:
+        return []
+    if result["relevant"] is None:
+        return result["documents"]
+    return [result["documents"][i] for i in result["relevant"]]
+
+
+def build_question_queue(results):
+    """Follow-up questions of the relevant documents, symptom by symptom in the order given.
+
+    Symptoms without relevant documents are announced in a preface on the
+    first question, the way the supervisor prompt asks for it.
+    """
+    queue = []
+    no_information = []
+    for result in sorted(results, key=lambda result: result["index"]):
+        documents = relevant_documents(result)
+        if not documents:
+            no_information.append(result["symptom"])
+            continue
+
+        seen = set()
+        for doc in documents:
+            for question in doc["metadata"].get("follow_up_questions", []):
+                key = " ".join(question.lower().split())
+                if question and key not in seen:
+                    seen.add(key)
+                    queue.append({"symptom": result["symptom"], "question": question})
+
+    if queue and no_information:
+        queue[0]["preface"] = (
+            f"I don't have information about these symptoms: {', '.join(no_information)}. "
+            "I can assist you with the other symptoms for which I found relevant documents."
+        )
+    return queue
+
+
+def ask_question(state):
+    """Ask the next queued follow-up question without calling the LLM."""
+    queue = state.get("question_queue") or []
+    item, rest = queue[0], queue[1:]
+
+    lines = []
+    if item.get("preface"):
+        lines.append(item["preface"])
+    previous = (state.get("follow_up_qna") or [{}])[-1]
+    if previous.get("symptom") != item["symptom"]:
+        lines.append(f"I have a few questions about your {item['symptom']}.")
+    lines.append(item["question"])
+
+    message = AIMessage(content="\n\n".join(lines), response_metadata={"finish_reason": "stop"})
+    return {"messages": [message], "question_queue": rest, "pending_question": item}
+
+
+def record_answer(state):
+    """Store the user's reply as the answer to the pending follow-up question."""
+    item = state["pending_question"]
+    answer = next(
+        (msg.content for msg in reversed(state["messages"]) if isinstance(msg, HumanMessage)),
+        "",
+    )
+    qna = (state.get("follow_up_qna") or []) + [
+        {"symptom": item["symptom"], "question": item["question"], "answer": answer}
+    ]
+    return {"follow_up_qna": qna, "pending_question": None}
+
+
+def archive_answers(state):
+    """Once diagnose_condition has answered, move the answers it used out of follow_up_qna.
+
+    They stay available to explain_diagnosis and recommend_treatment as
+    diagnosed_qna, but no longer ask the supervisor for a new diagnosis, and
+    a later process_symptoms round starts with an empty list.
+    """
+    diagnosed = False
+    for msg in reversed(state["messages"]):
+        if not isinstance(msg, ToolMessage):
+            break
+        diagnosed = diagnosed or msg.name == "diagnose_condition"
+    if not diagnosed or not state.get("follow_up_qna"):
+        return {}
+    return {"follow_up_qna": [], "diagnosed_qna": state["follow_up_qna"]}
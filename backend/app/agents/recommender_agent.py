@@ -1,11 +1,13 @@
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from typing import List, Dict
-from app.model.chatmodel import llm
+from app.model.chatmodel import get_llm
+from app.store.response_cache import response_cache
 
+llm = get_llm("recommendation")
 
 
-@tool
-def recommend_treatment(diagnosis:str, user_profile:str) -> str:
+
+def _recommend_treatment(diagnosis:str, user_profile:str) -> str:
     """
     Provide lifestyle or medical advice based on the user's diagnosis and profile.
 
@@ -20,6 +22,14 @@ def recommend_treatment(diagnosis:str, user_profile:str) -> str:
         str: 
             A string containing the recommended lifestyle changes or medical advice.
     """
+    return response_cache.call("recommend_treatment", recommendation_prompt, llm, diagnosis=diagnosis, user_profile=user_profile)
+
+
+async def _arecommend_treatment(diagnosis:str, user_profile:str) -> str:
+    return await response_cache.acall("recommend_treatment", recommendation_prompt, llm, diagnosis=diagnosis, user_profile=user_profile)
+
+
+def recommendation_prompt(diagnosis, user_profile):
     prompt = f"""
     You are an experienced medical assistant.
     Based on the following diagnosis and user profile, provide appropriate lifestyle changes or medical advice.
@@ -33,7 +43,14 @@ def recommend_treatment(diagnosis:str, user_profile:str) -> str:
 
     Recommendations:
     """
+    return prompt
+
+
+response_cache.register("recommend_treatment", recommendation_prompt)
 
-    response = llm.invoke(prompt)
-    return response 
+recommend_treatment = StructuredTool.from_function(
+    func=_recommend_treatment,
+    coroutine=_arecommend_treatment,
+    name="recommend_treatment",
+)
 
@@ -0,0 +1,99 @@
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from datetime import datetime, timezone
+
+from app.config import (
+    RELEVANCE_THRESHOLDS, RELEVANCE_ACCEPT_THRESHOLD, RELEVANCE_REJECT_THRESHOLD,
+    RELEVANCE_GATE_LOG, RELEVANCE_GATE_LOG_SAMPLE, RELEVANCE_GATE_LOG_MAX_BYTES, RELEVANCE_GATE_LOG_BACKUPS,
+)
+from app.store.embeddings import embedding_provider_id
+
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+UNCERTAIN = "uncertain"
+
+logger = logging.getLogger("relevance_gate")
+logger.propagate = False
+_listener = None
+
+
+def thresholds_for(provider_id, table=RELEVANCE_THRESHOLDS):
+    """(accept, reject) of an embedding provider: its own entry, else its family's, overridden by the env."""
+    accept, reject = table.get(provider_id) or table.get(provider_id.split(":")[0]) or table["openai"]
+    if RELEVANCE_ACCEPT_THRESHOLD is not None:
+        accept = RELEVANCE_ACCEPT_THRESHOLD
+    if RELEVANCE_REJECT_THRESHOLD is not None:
+        reject = RELEVANCE_REJECT_THRESHOLD
+    return accept, reject
+
+
+def configure_log(path=RELEVANCE_GATE_LOG, max_bytes=RELEVANCE_GATE_LOG_MAX_BYTES, backups=RELEVANCE_GATE_LOG_BACKUPS):
+    """Send gate records to a rotated file through a queue, so requests never wait on the disk."""
+    global _listener
+    if not path or _listener is not None:
+        return
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(records))
+    logger.setLevel(logging.INFO)
+    _listener = QueueListener(records, handler)
+    _listener.start()
+    # Flush what is still queued on shutdown
+    atexit.register(_listener.stop)
+
+
+class RelevanceGate:
+    """Decide from similarity scores whether retrieved documents need the LLM evaluator.
+
+    The thresholds depend on the embedding provider the index is queried
+    with. When RELEVANCE_GATE_LOG is set, a sample of the decisions (and of
+    the evaluator verdicts on the uncertain band) is logged as JSON lines so
+    the thresholds can be tuned offline.
+    """
+
+    def __init__(self, provider_id=None, sample=RELEVANCE_GATE_LOG_SAMPLE):
+        self.accept, self.reject = thresholds_for(provider_id or embedding_provider_id())
+        self.sample = sample
+        self.counts = {ACCEPTED: 0, REJECTED: 0, UNCERTAIN: 0}
+
+    def decide(self, symptom, scores):
+        top_score = max(scores) if scores else 0.0
+        if top_score >= self.accept:
+            decision = ACCEPTED
+        elif top_score < self.reject:
+            decision = REJECTED
+        else:
+            decision = UNCERTAIN
+
+        self.counts[decision] += 1
+        self._record({"symptom": symptom, "scores": [round(s, 4) for s in scores], "decision": decision})
+        return decision
+
+    def accepted_indices(self, scores):
+        """Positions of the documents that individually clear the accept threshold."""
+        return [i for i, score in enumerate(scores) if score >= self.accept]
+
+    def record_evaluation(self, symptoms, documents, verdict):
+        self._record({"symptoms": symptoms, "documents": documents, "evaluator_verdict": verdict})
+
+    def _record(self, entry):
+        if not logger.handlers or random.random() >= self.sample:
+            return
+        entry = {"at": datetime.now(timezone.utc).isoformat(), **entry}
+        logger.info(json.dumps(entry, default=str))
+
+    def stats(self):
+        return {
+            "accept_threshold": self.accept,
+            "reject_threshold": self.reject,
+            **self.counts,
+        }
+
+
+configure_log()
+relevance_gate = RelevanceGate()
@@ -1,11 +1,56 @@
-from langchain_core.tools import tool
-from app.store.data import get_vector_store
+import asyncio
+from langchain_core.tools import StructuredTool
+from typing import List
+from app.store.data import get_vector_store, get_embeddings
+from app.store.query_cache import query_embedding_cache
+from app.agents.relevance_gate import relevance_gate, ACCEPTED, REJECTED
 
 
-vector_store = get_vector_store()
+def search_symptoms(symptoms, k=3):
+    """[(Document, score), ...] per symptom.
 
-@tool(response_format="content_and_artifact")
-def retrieve(symptom: str):
+    Symptoms matching a knowledge-base key exactly (or through the alias
+    table) are answered from the lexical index; only the rest are embedded,
+    in one batch, and searched in FAISS.
+    """
+    vector_store = get_vector_store()
+    results = [vector_store.lexical_search(symptom) for symptom in symptoms]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        embeddings = query_embedding_cache.embed_queries([symptoms[i] for i in misses], get_embeddings())
+        for i, docs_and_scores in zip(misses, vector_store.search(embeddings, k=k)):
+            results[i] = docs_and_scores
+    return results
+
+
+def gate_documents(symptom, docs_and_scores):
+    """Apply the relevance gate to one symptom's search results."""
+    documents = [doc for doc, _ in docs_and_scores]
+    scores = [score for _, score in docs_and_scores]
+    relevance = relevance_gate.decide(symptom, scores)
+    if relevance == ACCEPTED:
+        keep = relevance_gate.accepted_indices(scores)
+        documents = [documents[i] for i in keep]
+        scores = [scores[i] for i in keep]
+    return {"symptom": symptom, "relevance": relevance, "documents": documents, "scores": scores}
+
+
+def format_result(result):
+    if result["relevance"] == REJECTED:
+        return "Relevance: rejected - no relevant documents found for this symptom."
+
+    header = (
+        "Relevance: accepted - these documents are relevant, do not call check_documents."
+        if result["relevance"] == ACCEPTED
+        else "Relevance: uncertain - verify these documents with check_documents."
+    )
+    return header + "\n\n" + "\n\n".join(
+        f"Symtom: {doc.page_content}\nMore_Details_About_Symptom: {doc.metadata}\nSimilarity: {score:.3f}"
+        for doc, score in zip(result["documents"], result["scores"])
+    )
+
+
+def _retrieve(symptom: str):
     """
     Retrieve follow up quetion based on user input.
 
@@ -14,10 +59,51 @@ def retrieve(symptom: str):
                        This should be a concise medical term rather than a free-form user input.
     """
 
-    
-    retrieved_docs = vector_store.similarity_search(symptom, k=3)
+    [docs_and_scores] = search_symptoms([symptom])
+    result = gate_documents(symptom, docs_and_scores)
+    return format_result(result), result
+
+
+async def _aretrieve(symptom: str):
+    # The search is CPU-bound FAISS work plus cache lookups, keep it off the event loop
+    return await asyncio.to_thread(_retrieve, symptom)
+
+
+def _retrieve_many(symptoms: List[str]):
+    """
+    Retrieve follow up questions for several symptoms in a single call.
+
+    Args:
+        symptoms (List[str]): The normalized or rewritten symptom queries (e.g., ['fever', 'headache']),
+                              in the order the user reported them.
+    """
+
+    results = [
+        gate_documents(symptom, docs_and_scores)
+        for symptom, docs_and_scores in zip(symptoms, search_symptoms(symptoms))
+    ]
+
     serialized = "\n\n".join(
-        (f"Symtom: {doc.page_content}\nMore_Details_About_Symptom: {doc.metadata}")
-        for doc in retrieved_docs
+        f"### Retrieved documents for: {result['symptom']}\n{format_result(result)}"
+        for result in results
     )
-    return serialized, retrieved_docs
\ No newline at end of file
+    return serialized, results
+
+
+async def _aretrieve_many(symptoms: List[str]):
+    return await asyncio.to_thread(_retrieve_many, symptoms)
+
+
+retrieve = StructuredTool.from_function(
+    func=_retrieve,
+    coroutine=_aretrieve,
+    name="retrieve",
+    response_format="content_and_artifact",
+)
+
+retrieve_many = StructuredTool.from_function(
+    func=_retrieve_many,
+    coroutine=_aretrieve_many,
+    name="retrieve_many",
+    response_format="content_and_artifact",
+)
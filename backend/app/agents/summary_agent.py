@@ -1,14 +1,78 @@
+import asyncio
+import weakref
+
 from langchain.schema import HumanMessage
-from langchain_core.messages import RemoveMessage 
+from langchain_core.messages import RemoveMessage, ToolMessage
 
 from .supervisor_agent import ExtendedMessagesState
-from app.model.chatmodel import llm
+from .context_window import total_tokens, count_tokens
+from app.config import SUMMARIZE_AT_TOKENS, SUMMARY_CHUNK_TOKENS, SUMMARY_MAX_CHUNKS
+from app.model.chatmodel import get_llm
 
+llm = get_llm("summarizer")
+
+# One lock per chat thread, held while a turn runs and while a summary is
+# committed, so the two never write the thread's checkpoint at the same time
+_thread_locks = weakref.WeakValueDictionary()
+_summarizing = set()
+_tasks = set()
+
+
+def new_messages(state: ExtendedMessagesState):
+    """Messages not yet folded into the summary: everything after the summary cursor.
+
+    Only messages up to the cursor are ever removed, so when the cursor
+    message itself is gone every remaining message is new.
+    """
+    messages = state["messages"]
+    cursor = state.get("summary_cursor")
+    ids = [m.id for m in messages]
+    if cursor in ids:
+        return messages[ids.index(cursor) + 1:]
+    return messages
+
+
+def transcript(messages, max_chars=None):
+    """Messages as plain text, so any slice of the history can be summarized on its own."""
+    lines = []
+    for m in messages:
+        content = m.content if isinstance(m.content, str) else str(m.content)
+        if max_chars and len(content) > max_chars:
+            content = content[:max_chars] + " [...]"
+        if isinstance(m, HumanMessage):
+            lines.append(f"User: {content}")
+        elif isinstance(m, ToolMessage):
+            lines.append(f"Tool result ({m.name}): {content}")
+        else:
+            calls = ", ".join(f"{c['name']}({c['args']})" for c in getattr(m, "tool_calls", None) or [])
+            if content:
+                lines.append(f"Assistant: {content}")
+            if calls:
+                lines.append(f"Assistant called: {calls}")
+    return "\n".join(lines)
+
+
+def chunk_messages(messages, counts, budget=SUMMARY_CHUNK_TOKENS):
+    """Split messages into consecutive chunks of at most `budget` tokens."""
+    chunks, chunk, used = [], [], 0
+    for m in messages:
+        tokens = counts.get(m.id) or count_tokens(m)
+        if chunk and used + tokens > budget:
+            chunks.append(chunk)
+            chunk, used = [], 0
+        chunk.append(m)
+        used += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def summary_request(state: ExtendedMessagesState, messages=None):
+    """The previous summary and the new messages, with the instruction to extend it."""
 
-def summarize_conversation(state: ExtendedMessagesState):
-    
     # First, we get any existing summary
     summary = state.get("summary", "")
+    messages = new_messages(state) if messages is None else messages
 
     # Create our summarization prompt 
     if summary:
@@ -16,18 +80,132 @@ def summarize_conversation(state: ExtendedMessagesState):
         # A summary already exists
         summary_message = (
             f"This is summary of the conversation to date: {summary}\n\n"
-            "Extend the summary by taking into account the new messages above:"
+            "Extend the summary by taking into account the new messages below:"
             " Keep the summary concise and relevant to the conversation.\n\n"
             "Use max 200 words for the summary.\n\n"
         )
         
     else:
-        summary_message = "Create a summary of the conversation above using max 200 words:"
-
-    # Add prompt to our history
-    messages = state["messages"] + [HumanMessage(content=summary_message)]
-    response = llm.invoke(messages)
-    
-    # Delete all but the 2 most recent messages
-    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-2]]
-    return {"summary": response.content, "messages": delete_messages}
+        summary_message = "Create a summary of the conversation below using max 200 words:\n\n"
+
+    # Each message is capped so a single huge tool payload cannot blow the budget
+    return [HumanMessage(content=summary_message + transcript(messages, max_chars=SUMMARY_CHUNK_TOKENS * 4))]
+
+
+def chunk_request(messages):
+    return [HumanMessage(content=(
+        "Summarize this part of a conversation between a user and a medical assistant in max 100 words."
+        " Keep symptoms, answers to follow-up questions, diagnoses and recommendations.\n\n"
+        + transcript(messages, max_chars=SUMMARY_CHUNK_TOKENS * 4)
+    ))]
+
+
+def merge_request(summary, chunk_summaries):
+    parts = "\n\n".join(f"Part {i + 1}: {text}" for i, text in enumerate(chunk_summaries))
+    previous = f"This is summary of the conversation to date: {summary}\n\n" if summary else ""
+    return [HumanMessage(content=(
+        previous
+        + "These are summaries of the newer parts of the conversation, in order:\n\n"
+        + parts
+        + "\n\nCombine them into one concise summary of the whole conversation. Use max 200 words for the summary."
+    ))]
+
+
+def summarized_messages(messages):
+    """Messages the summary replaces: everything before the latest user turn."""
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+    return messages[:last_human]
+
+
+def summary_update(state, summary, folded):
+    """Store the summary, move the cursor past the folded messages and drop those
+    of them that precede the latest user turn."""
+    messages = state["messages"]
+    if not folded:
+        return {"summary": summary}
+    end = [m.id for m in messages].index(folded[-1].id) + 1
+    return {
+        "summary": summary,
+        "summary_cursor": folded[-1].id,
+        # Delete all but the latest turn
+        "messages": [RemoveMessage(id=m.id) for m in summarized_messages(messages)[:end]],
+    }
+
+
+def pending_chunks(state):
+    """The new messages in summary-sized chunks, at most SUMMARY_MAX_CHUNKS of them per run.
+
+    A longer backlog (e.g. an old thread summarized for the first time) is
+    worked off over several runs, so no single run grows with the chat's age.
+    """
+    return chunk_messages(new_messages(state), state.get("token_counts") or {})[:SUMMARY_MAX_CHUNKS]
+
+
+def summarize_conversation(state: ExtendedMessagesState):
+    chunks = pending_chunks(state)
+    folded = [m for chunk in chunks for m in chunk]
+    if len(chunks) <= 1:
+        summary = llm.invoke(summary_request(state, folded)).content
+    else:
+        # Hierarchical: summarize each chunk, then merge the chunk summaries
+        parts = [llm.invoke(chunk_request(chunk)).content for chunk in chunks]
+        summary = llm.invoke(merge_request(state.get("summary", ""), parts)).content
+    return summary_update(state, summary, folded)
+
+
+async def asummarize_conversation(state: ExtendedMessagesState):
+    chunks = pending_chunks(state)
+    folded = [m for chunk in chunks for m in chunk]
+    if len(chunks) <= 1:
+        summary = (await llm.ainvoke(summary_request(state, folded))).content
+    else:
+        # Hierarchical: summarize the chunks concurrently, then merge the chunk summaries
+        parts = await asyncio.gather(*(llm.ainvoke(chunk_request(chunk)) for chunk in chunks))
+        summary = (await llm.ainvoke(merge_request(state.get("summary", ""), [p.content for p in parts]))).content
+    return summary_update(state, summary, folded)
+
+
+def thread_lock(thread_id):
+    lock = _thread_locks.get(thread_id)
+    if lock is None:
+        lock = _thread_locks[thread_id] = asyncio.Lock()
+    return lock
+
+
+async def summarize_in_background(graph, config):
+    """Summarize a thread that is over the token budget and commit the result to its checkpoint.
+
+    The LLM call runs without the thread lock, so a new message is never held
+    up by it; that turn simply still sees the old summary. Only the commit
+    takes the lock, and it only removes messages that still exist.
+    """
+    thread_id = config["configurable"]["thread_id"]
+    if thread_id in _summarizing:
+        return
+    _summarizing.add(thread_id)
+    try:
+        state = (await graph.aget_state(config)).values
+        if not state.get("messages") or total_tokens(state) <= SUMMARIZE_AT_TOKENS:
+            return
+        if not summarized_messages(state["messages"]) or not new_messages(state):
+            return
+
+        update = await asummarize_conversation(state)
+
+        async with thread_lock(thread_id):
+            current = {m.id for m in (await graph.aget_state(config)).values.get("messages", [])}
+            update["messages"] = [m for m in update["messages"] if m.id in current]
+            await graph.aupdate_state(config, update, as_node="summarize_conversation")
+        print(f"Summarized new messages of thread {thread_id}")
+    except Exception as e:
+        print(f"Background summarization of thread {thread_id} failed: {e}")
+    finally:
+        _summarizing.discard(thread_id)
+
+
+def schedule_summary(graph, config):
+    """Run summarize_in_background once the current response is done, keeping a reference to the task."""
+    task = asyncio.create_task(summarize_in_background(graph, config))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
@@ -5,20 +5,47 @@ from langchain.schema import SystemMessage
 
 from enum import Enum
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Annotated, Optional
 
-from app.model.chatmodel import llm
+from app.model.chatmodel import get_llm
+from app.store.user_profile import profile_service
 
-from .retriever import retrieve
+from .retriever import retrieve, retrieve_many
+from .symptom_processor import process_symptoms
+from .context_window import context_window
 from app.agents.evaluater_agent import check_documents
 from app.agents.diagnostic_agent import diagnose_condition
 from app.agents.recommender_agent import recommend_treatment
 from app.agents.explaination_agent import explain_diagnosis
 
+llm = get_llm("supervisor")
 
 
+
+def merge_symptom_results(existing, update):
+    """Collect the per-symptom results of parallel symptom_worker runs; None resets the list."""
+    if update is None:
+        return []
+    return (existing or []) + update
+
 class ExtendedMessagesState(MessagesState):
     summary: str
+    # Id of the last message folded into `summary`
+    summary_cursor: Optional[str]
+    symptom_results: Annotated[list, merge_symptom_results]
+    # Message id -> token count, filled in once per message by count_tokens
+    token_counts: dict
+    # Follow-up questions still to ask ({"symptom", "question"}), the one
+    # awaiting the user's answer, and the answers collected so far
+    question_queue: list
+    pending_question: Optional[dict]
+    follow_up_qna: list
+    # Answers of the last round diagnose_condition has already been called with
+    diagnosed_qna: list
+    # Formatted profile, loaded once per run by load_profile, and the id of
+    # the last message the background profile extraction has looked at
+    user_profile: Optional[str]
+    profile_cursor: Optional[str]
 
 class Gender(str, Enum):
     male = "male"
@@ -38,7 +65,9 @@ class UserProfile(BaseModel):
 
 
 llm_with_tool = llm.bind_tools([
+    process_symptoms,
     retrieve,
+    retrieve_many,
     check_documents,
     diagnose_condition,
     recommend_treatment,
@@ -46,7 +75,8 @@ llm_with_tool = llm.bind_tools([
 ])
 
 
-def supervisor(state: ExtendedMessagesState,config: RunnableConfig, store: BaseStore):
+def supervisor_messages(state: ExtendedMessagesState, formatted_memory):
+    """System prompt (with the stored profile and running summary) followed by the recent chat history."""
 
     summary = state.get("summary", "")
 
@@ -57,47 +87,50 @@ If the user asks non-medical questions, politely tell them to ask about their sy
 ### REQUIRED BEHAVIOR (must-follow)
 - You **must continuously ask for user symptoms** until the user explicitly says "no", "no more symptoms", or equivalent.
 - **Do not** begin retrieval or follow-up-question generation until the user has finished listing symptoms (i.e., said "no more symptoms").
-- For **every** symptom the user provides you **MUST**:
-    1. Rewrite the user's plain-language description into clear medical terminology. (This rewritten term is what you will pass to the `retrieve` tool.)
-    2. Call the `retrieve` tool with the rewritten medical-term symptom.
-    3. Call the `check_documents` tool with the symptom and the retrieved documents.
-    4. If `check_documents` returns **relevant documents**:
-        - Generate follow-up questions from those **returned relevant documents**.
-        - Ask **all** those follow-up questions for that symptom (one question at a time), waiting for the user's answer before asking the next question.
-    5. If `check_documents` indicates **no relevant documents found**, add that symptom to a "no information found" list and do **not** ask follow-up questions for that symptom.
-- You must process symptoms **sequentially in the order the user provided them**: rewrite → retrieve → check_documents → (ask follow-ups if relevant) → proceed to next symptom.
+- Once the user has finished listing symptoms you **MUST**:
+    1. Rewrite every plain-language symptom description into clear medical terminology.
+    2. Call the `process_symptoms` tool **once** with the list of rewritten medical terms, in the order the user provided them.
+       It retrieves and checks the documents for all symptoms at the same time. Its result contains one
+       "Retrieved documents for: <symptom>" section per symptom, in the order given.
+    3. Look at the `Relevance:` line of each section:
+        - `accepted`: the listed documents are the **relevant documents**.
+        - `checked`: the documents were verified for you; the listed documents are the **relevant documents**, or it says **no relevant documents found**.
+        - `rejected`: **no relevant documents found**.
+       Do **not** call `retrieve` or `check_documents` for these symptoms yourself.
+    4. The follow-up questions of the **relevant documents** are then asked for you, one at a time and symptom by symptom,
+       and the user's answers are collected. Do **not** ask them yourself.
+    5. Symptoms with **no relevant documents** are announced to the user together with the first follow-up question.
+       If **no** symptom has relevant documents, tell the user yourself (see INFORMING THE USER).
+- If the user later reports a single new symptom, call `process_symptoms` with just that symptom and handle it the same way.
 
 ### INFORMING THE USER
 - After processing all symptoms:
   - If any symptoms were added to the "no information found" list, tell the user:
     "I don't have information about these symptoms: [list]. I can assist you with the other symptoms for which I found relevant documents."
-  - For symptoms with relevant documents, you must have already asked **all** follow-up questions (one at a time) and collected answers before moving on.
+  - For symptoms with relevant documents, the collected follow-up answers are listed under FINAL CONTEXT.
   
 ### DIAGNOSIS & NEXT STEPS
-- Once you have gathered sufficient information from follow-up Q&A for the relevant symptoms:
-  - Provide a possible diagnosis by calling `diagnose_condition`.
+- When you are called with new follow-up answers under FINAL CONTEXT, all follow-up questions have been answered:
+  - Provide a possible diagnosis by calling `diagnose_condition` with those answers.
   - Ask the user whether they want an explanation of the diagnosis (use `explain_diagnosis` if they request it).
   - Ask the user whether they want treatment recommendations (use `recommend_treatment` if they request it).
+- Answers listed as already used for a diagnosis must **not** be diagnosed again; pass them to `explain_diagnosis`
+  and `recommend_treatment` when the user asks for those.
 
 ### QUESTION FLOW RULES
 - Always ask **one** question at a time and wait for the user's response.
-- Never skip or omit any follow-up question generated from relevant retrieved documents.
 - If the user supplies only a single symptom (e.g., "I have a headache"), repeatedly ask:
     "Are you experiencing any other symptoms?" until they reply "no" / "no more symptoms".
 - If the user supplies multiple symptoms in one message, still ask:
     "Are you experiencing any other symptoms?" and continue asking until they say "no" / "no more symptoms".
-- Only after the user confirms they are done listing symptoms, proceed with the sequential retrieve/check_documents flow described above.
+- Only after the user confirms they are done listing symptoms, call `process_symptoms` as described above.
 
 ### TOOL USAGE (example pseudo-calls)
 - After user finishes listing symptoms:
-  For symptom in symptoms_in_order:
-    - retrieved_docs = retrieve(medical_term)
-    - relevant_docs = check_documents(symptom, retrieved_docs)
-    - if relevant_docs is not empty:
-         - followup_questions = generate_questions_from(relevant_docs)
-         - ask each question one at a time, waiting for answers
-      else:
-         - add symptom to no-info list
+  results = process_symptoms([medical_term for symptom in symptoms_in_order])
+  (the follow-up questions of the relevant documents are asked automatically)
+- Once follow-up answers are listed under FINAL CONTEXT:
+  diagnosis = diagnose_condition(symptoms, follow_up_answers, user_profile)
 
 ### Example Interaction - Single Symptom
 User: "I have a pain in the head"
@@ -105,68 +138,69 @@ Assistant: "Are you experiencing any other symptoms?"
 User: "No."
 Assistant:
   - Rewrite "pain in the head" → "headache"
-  - Call: retrieve("headache")
-  - Call: check_documents("headache", retrieved_docs_for_headache)
-  - If relevant_docs not empty → generate follow-up Qs from relevant_docs and ask them one-by-one
+  - Call: process_symptoms(["headache"])
+  - If relevant_docs not empty → the follow-up Qs are asked automatically; once their answers are listed, call diagnose_condition
   - If relevant_docs empty → tell user "I don't have information about this symptom: headache."
 
-### Example Interaction - Multiple Symptoms (shows sequential retrieve & checks and asking for more symptoms)
+### Example Interaction - Multiple Symptoms
 User: "I have pain in the chest and shortness of breath."
 Assistant: "Are you experiencing any other symptoms?"
 User: "Yes, dizziness."
 Assistant: "Are you experiencing any other symptoms?"
 User: "No."
-Assistant (processing starts now, in order provided):
-  1) Rewrite "pain in the chest" → "chest pain"
-     - Call: retrieve("chest pain")
-     - Call: check_documents("chest pain", retrieved_docs_for_chest_pain)
-     - If relevant_docs not empty → generate ALL follow-up Qs for chest pain; ask them one at a time.
-     - If relevant_docs empty → add "chest pain" to no-info list.
-  2) Rewrite "shortness of breath" → "dyspnea"
-     - Call: retrieve("dyspnea")
-     - Call: check_documents("dyspnea", retrieved_docs_for_dyspnea)
-     - If relevant_docs not empty → generate ALL follow-up Qs for dyspnea; ask them one at a time.
-     - If relevant_docs empty → add "shortness of breath" to no-info list.
-  3) Rewrite "dizziness" → "dizziness"
-     - Call: retrieve("dizziness")
-     - Call: check_documents("dizziness", retrieved_docs_for_dizziness)
-     - If relevant_docs not empty → generate ALL follow-up Qs for dizziness; ask them one at a time.
-     - If relevant_docs empty → add "dizziness" to no-info list.
-Assistant: After processing all symptoms, say:
-  - "I don't have information about these symptoms: [list]" (if any)
-  - Continue only with symptoms for which relevant documents were found and for which follow-up Q&A was completed.
+Assistant (processing starts now):
+  - Rewrite "pain in the chest" → "chest pain", "shortness of breath" → "dyspnea", "dizziness" → "dizziness"
+  - Call: process_symptoms(["chest pain", "dyspnea", "dizziness"])
+  - The follow-up Qs for chest pain, dyspnea and dizziness (those with relevant documents) are asked automatically, in that order,
+    and symptoms without relevant documents are reported to the user.
+  - Once the follow-up answers are listed under FINAL CONTEXT → Call: diagnose_condition(...)
 
 
 ### FINAL CONTEXT
 Here is the user profile information (it may be empty): {formatted_memory}
 Summary of the conversation so far (it may be empty): {summary}
+Follow-up questions answered by the user, not yet diagnosed (it may be empty): {follow_up_qna}
+Follow-up answers already used for the latest diagnosis (it may be empty): {diagnosed_qna}
 """
 
 
-    user_id = config["configurable"]["user_id"]
-    namespace_for_memory = ("user_profile", user_id)
-    user_profile = store.get(namespace_for_memory, "user_details")
-    formatted_memory = None
-    if user_profile and user_profile.value:
-        memory_dict = user_profile.value
-        formatted_memory = (
-            f"Name: {memory_dict.get('user_name', 'Unknown')}\n"
-            f"Known Medical Conditions: {', '.join(memory_dict.get('conditions', []))}"
-            f"Age: {memory_dict.get('age', 'Unknown')}\n"
-            f"Gender: {memory_dict.get('gender', 'Unknown')}\n"
-        )
-    else:
-        formatted_memory = None
-    
+    follow_up_qna, diagnosed_qna = (
+        "\n".join(f"[{item['symptom']}] Q: {item['question']} A: {item['answer']}" for item in state.get(key) or [])
+        for key in ("follow_up_qna", "diagnosed_qna")
+    )
+
     system_message = None
     if summary:
         system_message = SystemMessage(
-            content=prompt.format(formatted_memory=formatted_memory, summary=summary)
+            content=prompt.format(
+                formatted_memory=formatted_memory, summary=summary,
+                follow_up_qna=follow_up_qna, diagnosed_qna=diagnosed_qna,
+            )
         )
     else:
         system_message = SystemMessage(
-            content=prompt.format(formatted_memory=formatted_memory, summary="")
+            content=prompt.format(
+                formatted_memory=formatted_memory, summary="",
+                follow_up_qna=follow_up_qna, diagnosed_qna=diagnosed_qna,
+            )
         )
-    messages = [system_message] + state["messages"]
-    response = llm_with_tool.invoke(messages)
-    return {"messages": response}
\ No newline at end of file
+    return [system_message] + context_window(state)
+
+
+def supervisor(state: ExtendedMessagesState,config: RunnableConfig, store: BaseStore):
+    formatted_memory = state.get("user_profile")
+    if formatted_memory is None:
+        formatted_memory = profile_service.formatted(store, config["configurable"]["user_id"])
+    response = llm_with_tool.invoke(supervisor_messages(state, formatted_memory))
+    return {"messages": response}
+
+
+async def asupervisor(state: ExtendedMessagesState, config: RunnableConfig, store: BaseStore):
+    # The profile was put into the state by load_profile at the start of the run
+    response = await llm_with_tool.ainvoke(supervisor_messages(state, state.get("user_profile")))
+    return {"messages": response}
+
+
+async def load_profile(state: ExtendedMessagesState, config: RunnableConfig, store: BaseStore):
+    """Read the user's profile once per graph run instead of on every supervisor loop."""
+    return {"user_profile": await profile_service.aformatted(store, config["configurable"]["user_id"])}
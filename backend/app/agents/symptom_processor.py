@@ -0,0 +1,148 @@
+import asyncio
+from typing import List
+from typing_extensions import TypedDict
+
+from langchain.schema import Document
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import StructuredTool
+from langgraph.types import Send
+
+from app.agents.retriever import search_symptoms, gate_documents, format_result
+from app.agents.evaluater_agent import arelevant_document_indices
+from app.agents.relevance_gate import UNCERTAIN
+from app.agents.question_engine import build_question_queue, relevant_documents
+
+
+class SymptomTask(TypedDict):
+    """Input of one symptom_worker run, sent by route_symptoms."""
+    index: int
+    symptom: str
+    docs_and_scores: list
+
+
+async def asearch_symptoms(symptoms):
+    """search_symptoms off the event loop: one batched embedding request and FAISS search for all symptoms."""
+    return await asyncio.to_thread(search_symptoms, symptoms)
+
+
+async def process_symptom(index, symptom, docs_and_scores):
+    """Gate and (only when the gate is unsure) evaluate one symptom's search results."""
+    result = gate_documents(symptom, docs_and_scores)
+
+    # Positions of the documents the evaluator kept; None when the gate decided on its own
+    relevant = None
+    if result["relevance"] == UNCERTAIN:
+        relevant = await arelevant_document_indices(
+            [symptom],
+            [
+                f"Symtom: {doc.page_content}\nMore_Details_About_Symptom: {doc.metadata}"
+                for doc in result["documents"]
+            ],
+        )
+
+    return {
+        "index": index,
+        "symptom": symptom,
+        "relevance": result["relevance"],
+        "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in result["documents"]],
+        "scores": result["scores"],
+        "relevant": relevant,
+    }
+
+
+def format_symptom_result(result):
+    if result["relevant"] is not None:
+        if not result["relevant"]:
+            return "Relevance: checked - no relevant documents found for this symptom."
+        return "Relevance: checked - these documents were verified as relevant.\n\n" + "\n\n".join(
+            f"Symtom: {doc['page_content']}\nMore_Details_About_Symptom: {doc['metadata']}"
+            for doc in relevant_documents(result)
+        )
+    return format_result({
+        **result,
+        "documents": [Document(**doc) for doc in result["documents"]],
+    })
+
+
+def format_symptom_results(results):
+    return "\n\n".join(
+        f"### Retrieved documents for: {result['symptom']}\n{format_symptom_result(result)}"
+        for result in sorted(results, key=lambda result: result["index"])
+    )
+
+
+def _process_symptoms(symptoms: List[str]):
+    """
+    Retrieve and check the knowledge-base documents for all of the user's symptoms at once.
+
+    Args:
+        symptoms (List[str]): The normalized or rewritten symptom queries (e.g., ['fever', 'headache']),
+                              in the order the user reported them.
+    """
+    return asyncio.run(_aprocess_symptoms(symptoms))
+
+
+async def _aprocess_symptoms(symptoms: List[str]):
+    searched = await asearch_symptoms(symptoms)
+    results = await asyncio.gather(*(
+        process_symptom(i, symptom, docs_and_scores)
+        for i, (symptom, docs_and_scores) in enumerate(zip(symptoms, searched))
+    ))
+    return format_symptom_results(results), list(results)
+
+
+# In the graph, process_symptoms calls are not run by the ToolNode: the
+# supervisor's call is fanned out to one symptom_worker per symptom and
+# joined back by join_symptoms. The tool itself serves direct use.
+process_symptoms = StructuredTool.from_function(
+    func=_process_symptoms,
+    coroutine=_aprocess_symptoms,
+    name="process_symptoms",
+    response_format="content_and_artifact",
+)
+
+
+async def route_symptoms(state):
+    """Search all symptoms of the supervisor's process_symptoms call in one batch, then send one
+    symptom_worker per symptom with its results; only the evaluations run in parallel."""
+    call = next(c for c in state["messages"][-1].tool_calls if c["name"] == "process_symptoms")
+    symptoms = call["args"].get("symptoms", [])
+    if not symptoms:
+        return "join_symptoms"
+    searched = await asearch_symptoms(symptoms)
+    return [
+        Send("symptom_worker", {"index": i, "symptom": symptom, "docs_and_scores": docs_and_scores})
+        for i, (symptom, docs_and_scores) in enumerate(zip(symptoms, searched))
+    ]
+
+
+async def symptom_worker(state: SymptomTask):
+    result = await process_symptom(state["index"], state["symptom"], state["docs_and_scores"])
+    return {"symptom_results": [result]}
+
+
+def join_symptoms(state):
+    """Answer the process_symptoms call with the worker results in the order the symptoms were given,
+    and queue the follow-up questions of the relevant documents."""
+    results = sorted(state.get("symptom_results") or [], key=lambda result: result["index"])
+    messages = []
+    for call in state["messages"][-1].tool_calls:
+        if call["name"] == "process_symptoms":
+            messages.append(ToolMessage(
+                content=format_symptom_results(results),
+                artifact=results,
+                tool_call_id=call["id"],
+                name=call["name"],
+            ))
+        else:
+            # Every tool call needs an answer; others in the same turn are not run
+            messages.append(ToolMessage(
+                content="Not run: call this tool again after process_symptoms has returned.",
+                tool_call_id=call["id"],
+                name=call["name"],
+            ))
+    return {
+        "messages": messages,
+        "symptom_results": None,
+        "question_queue": (state.get("question_queue") or []) + build_question_queue(results),
+    }
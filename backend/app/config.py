@@ -3,4 +3,101 @@ from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
-DB_URL = os.getenv("DATABASE_URL")
\ No newline at end of file
+DB_URL = os.getenv("DATABASE_URL")
+
+# Query-embedding cache for the retrieve tool
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))
+QUERY_CACHE_DB_TTL = int(os.getenv("QUERY_CACHE_DB_TTL", str(7 * 24 * 3600)))
+
+# Similarity-score gate in front of the check_documents evaluator. Retrievals
+# whose best cosine score is >= the accept threshold skip the evaluator, those
+# below the reject threshold are treated as "no relevant documents".
+# (accept, reject) per embedding provider id, or per provider family when the
+# full id has no entry: the embedders' score ranges differ widely.
+RELEVANCE_THRESHOLDS = {
+    "openai": (0.90, 0.78),
+    "hashing": (0.80, 0.30),
+    "local": (0.80, 0.45),
+}
+# When set, these override the table for every provider
+RELEVANCE_ACCEPT_THRESHOLD = float(os.environ["RELEVANCE_ACCEPT_THRESHOLD"]) if os.getenv("RELEVANCE_ACCEPT_THRESHOLD") else None
+RELEVANCE_REJECT_THRESHOLD = float(os.environ["RELEVANCE_REJECT_THRESHOLD"]) if os.getenv("RELEVANCE_REJECT_THRESHOLD") else None
+# Opt-in decision log for tuning the thresholds offline: a size-capped,
+# rotated JSONL file written off the request path, sampled at RELEVANCE_GATE_LOG_SAMPLE
+RELEVANCE_GATE_LOG = os.getenv("RELEVANCE_GATE_LOG", "")
+RELEVANCE_GATE_LOG_SAMPLE = float(os.getenv("RELEVANCE_GATE_LOG_SAMPLE", "1.0"))
+RELEVANCE_GATE_LOG_MAX_BYTES = int(os.getenv("RELEVANCE_GATE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+RELEVANCE_GATE_LOG_BACKUPS = int(os.getenv("RELEVANCE_GATE_LOG_BACKUPS", "3"))
+
+# Load the knowledge-base index in the lifespan instead of on the first retrieve
+KB_WARM_ON_STARTUP = os.getenv("KB_WARM_ON_STARTUP", "true").lower() == "true"
+
+# Embedding backend for the knowledge base: "openai", "hashing" (local hashed
+# character n-grams, no network) or "local" (sentence-transformers model on disk)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "512"))
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "")
+
+# Alias -> canonical symptom table for the lexical fast path of the retrieve tool
+SYMPTOM_ALIASES_FILE = os.getenv("SYMPTOM_ALIASES_FILE", "app/store/symptom_aliases.json")
+
+# Shared secret for /api/admin/* endpoints (sent as X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Model tiers for app/model/chatmodel.py; each agent role is mapped to one
+MODEL_TIERS = {
+    "fast": os.getenv("MODEL_TIER_FAST", "gpt-4o-mini"),
+    "strong": os.getenv("MODEL_TIER_STRONG", "gpt-4o"),
+}
+
+# Response cache for the diagnose/explain/recommend tools
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_DB_TTL = int(os.getenv("RESPONSE_CACHE_DB_TTL", str(30 * 24 * 3600)))
+
+# Token budgets for the conversation history: the supervisor sees at most
+# CONTEXT_WINDOW_TOKENS of recent messages, and the conversation is
+# summarized once the whole history exceeds SUMMARIZE_AT_TOKENS. The summary
+# has to start before the window drops anything, so SUMMARIZE_AT_TOKENS is
+# capped at the window budget.
+CONTEXT_WINDOW_TOKENS = int(os.getenv("CONTEXT_WINDOW_TOKENS", "8000"))
+# Messages the summary does not cover yet stretch the window past its budget,
+# but never past this hard cap, even while no summary exists or the summarizer fails
+CONTEXT_WINDOW_MAX_TOKENS = max(int(os.getenv("CONTEXT_WINDOW_MAX_TOKENS", str(2 * CONTEXT_WINDOW_TOKENS))), CONTEXT_WINDOW_TOKENS)
+SUMMARIZE_AT_TOKENS = min(int(os.getenv("SUMMARIZE_AT_TOKENS", "6000")), CONTEXT_WINDOW_TOKENS)
+# Largest slice of new messages summarized in one call; longer deltas are
+# summarized chunk by chunk and the chunk summaries merged
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "4000"))
+SUMMARY_MAX_CHUNKS = int(os.getenv("SUMMARY_MAX_CHUNKS", "8"))
+
+# Per-process cache of user profiles and their formatted prompt fragment,
+# checked against the profile's shared version on every read
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1024"))
+
+# Async connection pool shared by the LangGraph checkpointer and store
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Pool of the sync SQLAlchemy engine (app/db.py)
+DB_ENGINE_POOL_SIZE = int(os.getenv("DB_ENGINE_POOL_SIZE", "5"))
+DB_ENGINE_MAX_OVERFLOW = int(os.getenv("DB_ENGINE_MAX_OVERFLOW", "10"))
+
+# Checkpoint retention (app/agent_memory/retention.py): the latest
+# CHECKPOINT_KEEP checkpoints of every thread are kept, older ones are deleted
+# CHECKPOINT_RETENTION_BATCH threads per transaction, every
+# CHECKPOINT_RETENTION_INTERVAL seconds (0 disables the background job)
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "10"))
+CHECKPOINT_RETENTION_BATCH = int(os.getenv("CHECKPOINT_RETENTION_BATCH", "50"))
+CHECKPOINT_RETENTION_INTERVAL = int(os.getenv("CHECKPOINT_RETENTION_INTERVAL", "3600"))
+# Longest a batch waits for a row lock before it is skipped until the next run
+CHECKPOINT_LOCK_TIMEOUT = os.getenv("CHECKPOINT_LOCK_TIMEOUT", "2s")
+# Seconds after startup before a worker's first pass, plus up to
+# CHECKPOINT_RETENTION_JITTER random seconds before every pass so workers do
+# not all wake up at once; only one of them runs a pass at a time anyway
+CHECKPOINT_RETENTION_DELAY = int(os.getenv("CHECKPOINT_RETENTION_DELAY", "300"))
+CHECKPOINT_RETENTION_JITTER = int(os.getenv("CHECKPOINT_RETENTION_JITTER", "300"))
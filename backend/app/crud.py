@@ -1,21 +1,150 @@
-from sqlalchemy.orm import Session
-from .models import Chat
+import json
+import base64
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from langchain.schema import HumanMessage, AIMessage
+from .models import Chat, ChatMessage
 from datetime import datetime,timezone
 
-def create_chat_record(db, user_id: str, chat_id: str, is_public: bool, chat_name: str = "new chat"):
+async def create_chat_record(db: AsyncSession, user_id: str, chat_id: str, is_public: bool, chat_name: str = "new chat"):
     chat = Chat(
         user_id=user_id,
         chat_id=chat_id,
         is_public=is_public,
         chat_name=chat_name,
-        updated_at=datetime.now(timezone.utc).isoformat(),
+        updated_at=datetime.now(timezone.utc),
     )
     db.add(chat)
-    db.commit()
-    db.refresh(chat)
+    await db.commit()
+    await db.refresh(chat)
     return chat
 
 
 
-def get_chats_by_user_id(db: Session, user_id: str):
-    return db.query(Chat).filter(Chat.user_id == user_id).all()
\ No newline at end of file
+def chat_cursor(chat):
+    """Opaque keyset cursor holding the (updated_at, chat_id) the next page starts below."""
+    payload = json.dumps([chat.updated_at.isoformat(), chat.chat_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def parse_chat_cursor(cursor):
+    """(updated_at, chat_id) of a chat_cursor(); raises ValueError for anything else."""
+    try:
+        updated_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(updated_at), str(chat_id)
+    except Exception as e:
+        raise ValueError(f"Invalid chat cursor: {cursor!r}") from e
+
+
+async def get_chats_by_user_id(db: AsyncSession, user_id: str, limit=None, before=None):
+    """A user's chats, most recently active first.
+
+    Keyset pagination: `before` is the next_cursor of the previous page. It
+    carries the position itself, so chats touched while paging do not
+    shift the pages. Returns the chats and the cursor of the next page, or None.
+    """
+    statement = select(Chat).where(Chat.user_id == user_id)
+    if before is not None:
+        updated_at, chat_id = parse_chat_cursor(before)
+        statement = statement.where(tuple_(Chat.updated_at, Chat.chat_id) < tuple_(updated_at, chat_id))
+    statement = statement.order_by(Chat.updated_at.desc(), Chat.chat_id.desc())
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    chats = (await db.execute(statement)).scalars().all()
+
+    next_cursor = None
+    if limit is not None and len(chats) > limit:
+        chats = chats[:limit]
+        next_cursor = chat_cursor(chats[-1])
+    return chats, next_cursor
+
+
+async def get_chat(db: AsyncSession, chat_id: str):
+    return await db.get(Chat, chat_id)
+
+
+async def rename_chat(db: AsyncSession, chat_id: str, chat_name: str):
+    chat = await db.get(Chat, chat_id)
+    if chat is None:
+        return None
+    chat.chat_name = chat_name
+    await db.commit()
+    return chat
+
+
+async def touch_chat(db: AsyncSession, chat_id: str):
+    """Mark a chat as just active, moving it to the top of the chat list."""
+    await db.execute(update(Chat).where(Chat.chat_id == chat_id).values(updated_at=func.now()))
+    await db.commit()
+
+
+async def set_chat_visibility(db: AsyncSession, chat: Chat, is_public: bool):
+    chat.is_public = is_public
+    await db.commit()
+    return chat
+
+
+def visible_messages(messages):
+    """The user-visible part of LangGraph messages: user messages and final (finish_reason "stop") AI answers."""
+    visible = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            visible.append({"message_id": msg.id, "role": "user", "content": msg.content})
+        elif isinstance(msg, AIMessage) and msg.response_metadata.get("finish_reason") == "stop":
+            visible.append({"message_id": msg.id, "role": "ai", "content": msg.content})
+    return visible
+
+
+async def append_chat_messages(db: AsyncSession, chat_id: str, messages):
+    """Append visible_messages() entries to a chat's transcript; entries already stored are skipped."""
+    if not messages:
+        return
+    await db.execute(
+        insert(ChatMessage)
+        .values([{"chat_id": chat_id, **message} for message in messages])
+        .on_conflict_do_nothing(index_elements=["chat_id", "message_id"])
+    )
+    await db.commit()
+
+
+async def get_chat_messages(db: AsyncSession, chat_id: str, limit=None, before=None):
+    """A page of a chat's transcript in chronological order: the `limit` latest messages older than `before`.
+
+    Returns the messages and the cursor of the next (older) page, or None.
+    """
+    statement = select(ChatMessage).where(ChatMessage.chat_id == chat_id)
+    if before is not None:
+        statement = statement.where(ChatMessage.id < before)
+    statement = statement.order_by(ChatMessage.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    rows = (await db.execute(statement)).scalars().all()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return list(reversed(rows)), next_cursor
+
+
+async def last_chat_message_id(db: AsyncSession, chat_id: str):
+    """message_id of the newest transcript entry of a chat: the watermark the next sync starts after."""
+    result = await db.execute(
+        select(ChatMessage.message_id).where(ChatMessage.chat_id == chat_id).order_by(ChatMessage.id.desc()).limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def sync_chat_messages(db: AsyncSession, chat_id: str, messages):
+    """Append every visible LangGraph message after the transcript's watermark.
+
+    Messages of a turn whose stream was cut off are picked up by the next
+    sync. When the watermark is not among `messages` (a new transcript, or
+    the message was removed from the state) all of them are offered;
+    those already stored are skipped.
+    """
+    last = await last_chat_message_id(db, chat_id)
+    ids = [message.id for message in messages]
+    start = ids.index(last) + 1 if last in ids else 0
+    await append_chat_messages(db, chat_id, visible_messages(messages[start:]))
@@ -1,9 +1,39 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DB_URL
+from .config import DB_URL, DB_ENGINE_POOL_SIZE, DB_ENGINE_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_MAX_LIFETIME
 
-engine = create_engine(DB_URL)
+POOL_OPTIONS = {
+    "pool_size": DB_ENGINE_POOL_SIZE,
+    "max_overflow": DB_ENGINE_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_MAX_LIFETIME,
+    "pool_pre_ping": True,
+}
+
+# Sync engine for migrations and the caches, which run their queries in threads
+engine = create_engine(DB_URL, **POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_url(url):
+    """The same database through the psycopg (v3) async driver."""
+    return make_url(url).set(drivername="postgresql+psycopg")
+
+
+# Async engine for the request handlers, so database round-trips never block the event loop
+async_engine = create_async_engine(async_url(DB_URL), **POOL_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+
+def engine_pool_stats(engine=engine):
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_ENGINE_MAX_OVERFLOW,
+    }
@@ -2,7 +2,9 @@ from langgraph.graph import StateGraph, MessagesState, START, END
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from app.model.chatmodel import llm
+from app.model.chatmodel import get_llm
+
+llm = get_llm("chat_naming")
 
 
 from langchain.schema import HumanMessage, SystemMessage
@@ -20,7 +22,7 @@ class ResponseFormatter(BaseModel):
     chat_name: str = Field(description="The name of the chat, based on the user's input.")
 
 
-def call_model(state: MessagesState):
+async def call_model(state: MessagesState):
     system_instruction = SystemMessage(
         content=(
             "You can summarize chat summary in max 2 words"
@@ -28,7 +30,7 @@ def call_model(state: MessagesState):
     )
 
     messages = [system_instruction] + state["messages"]
-    response = llm.invoke(messages)
+    response = await llm.ainvoke(messages)
     return {"messages": response}
 
 
@@ -1,36 +1,65 @@
 from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import ToolNode
 
 from PIL import Image
 import io
 
-from app.agents.supervisor_agent import supervisor, ExtendedMessagesState
-from app.agents.retriever import retrieve
+from app.agents.supervisor_agent import asupervisor, load_profile, ExtendedMessagesState
+from app.agents.retriever import retrieve, retrieve_many
 from app.agents.evaluater_agent import check_documents
 from app.agents.diagnostic_agent import diagnose_condition
-from app.agents.summary_agent import summarize_conversation
-from app.agents.memory_agent import write_memory
+from app.agents.summary_agent import asummarize_conversation
+from app.agents.memory_agent import awrite_memory
 from app.agents.explaination_agent import explain_diagnosis
 from app.agents.recommender_agent import recommend_treatment
+from app.agents.symptom_processor import route_symptoms, symptom_worker, join_symptoms
+from app.agents.question_engine import ask_question, record_answer, archive_answers
+from app.agents.context_window import count_new_messages
 
-tools = ToolNode([retrieve, check_documents, diagnose_condition, explain_diagnosis, recommend_treatment])
+tools = ToolNode([retrieve, retrieve_many, check_documents, diagnose_condition, explain_diagnosis, recommend_treatment])
 
 def should_continue(state: ExtendedMessagesState):
     
     """Return the next node to execute."""
-    messages = state["messages"]
-    # If there are more than 40 messages, then we summarize the conversation
-    if len(messages) > 40:
-        return "summarize_conversation" 
-    # Otherwise we can just end
+    # The user is answering a queued follow-up question
+    if state.get("pending_question"):
+        return "record_answer"
+    # Summarization is not on this path: it runs after the response has been
+    # streamed (see summarize_in_background)
     return "supervisor"
 
+def next_question_or_supervisor(state: ExtendedMessagesState):
+    """Keep asking queued follow-up questions; the supervisor only runs once the queue is drained."""
+    if state.get("question_queue"):
+        return "ask_question"
+    return "supervisor"
+
+async def route_supervisor(state: ExtendedMessagesState):
+    """tools_condition, except that process_symptoms calls fan out to one symptom_worker per symptom."""
+    tool_calls = getattr(state["messages"][-1], "tool_calls", None)
+    if not tool_calls:
+        # Profile extraction runs after the response (see extract_profile_in_background)
+        return END
+    if any(call["name"] == "process_symptoms" for call in tool_calls):
+        return await route_symptoms(state)
+    return "tools"
+
 def create_graph(store, checkpointer):
     builder = StateGraph(ExtendedMessagesState)
-    builder.add_node("supervisor", supervisor)
+    # Async nodes and tools (ainvoke) so one event loop can serve many chats
+    builder.add_node("load_profile", load_profile)
+    builder.add_node("count_tokens", count_new_messages)
+    builder.add_node("supervisor", asupervisor)
     builder.add_node("tools", tools)
-    builder.add_node("summarize_conversation", summarize_conversation)
-    builder.add_node("write_memory", write_memory)
+    # Not reached from START: summarize_in_background commits its summary as this node
+    builder.add_node("summarize_conversation", asummarize_conversation)
+    # Not reached from START either: extract_profile_in_background commits its cursor as this node
+    builder.add_node("write_memory", awrite_memory)
+    builder.add_node("symptom_worker", symptom_worker)
+    builder.add_node("join_symptoms", join_symptoms)
+    builder.add_node("ask_question", ask_question)
+    builder.add_node("record_answer", record_answer)
+    builder.add_node("archive_answers", archive_answers)
 
 
     # builder.add_edge(START, "assistant")
@@ -41,25 +70,37 @@ def create_graph(store, checkpointer):
     # )
     # builder.add_edge("tools", "assistant")
 
+    builder.add_edge(START, "load_profile")
+    builder.add_edge("load_profile", "count_tokens")
     builder.add_conditional_edges(
-        START,
+        "count_tokens",
         should_continue,
         {
-            "summarize_conversation": "summarize_conversation",
+            "record_answer": "record_answer",
             "supervisor": "supervisor",
         },
     )
-    builder.add_edge("summarize_conversation", "supervisor")
+    builder.add_edge("summarize_conversation", END)
     builder.add_conditional_edges(
         "supervisor",
-        tools_condition,
-        {
-            END: "write_memory",
-            "tools": "tools",
-        } 
+        route_supervisor,
+        [END, "tools", "symptom_worker", "join_symptoms"],
     )
 
-    builder.add_edge("tools", "supervisor")
+    builder.add_edge("tools", "archive_answers")
+    builder.add_edge("archive_answers", "supervisor")
+    builder.add_edge("symptom_worker", "join_symptoms")
+    builder.add_conditional_edges(
+        "join_symptoms",
+        next_question_or_supervisor,
+        ["ask_question", "supervisor"],
+    )
+    builder.add_conditional_edges(
+        "record_answer",
+        next_question_or_supervisor,
+        ["ask_question", "supervisor"],
+    )
+    builder.add_edge("ask_question", END)
     builder.add_edge("write_memory", END)
 
 
@@ -3,14 +3,23 @@ from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, PlainTextResponse
 from uuid import uuid4
-from fastapi import Request, Depends, HTTPException
-from .models import Chat
+from fastapi import Request, Depends, HTTPException, Query
 from .deps import get_db
-from .crud import create_chat_record, get_chats_by_user_id
-from sqlalchemy.orm import Session
-from .db import Base, engine
+from .crud import (
+    create_chat_record, get_chats_by_user_id, get_chat, rename_chat, set_chat_visibility,
+    visible_messages, append_chat_messages, get_chat_messages, sync_chat_messages, touch_chat,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db import async_engine, engine_pool_stats, AsyncSessionLocal
+from .config import KB_WARM_ON_STARTUP, ADMIN_TOKEN, CHECKPOINT_RETENTION_INTERVAL
 from pydantic import BaseModel, Field
 from app.agents.supervisor_agent import UserProfile
+from app.store.query_cache import query_embedding_cache
+from app.agents.relevance_gate import relevance_gate
+from app.store.lexical import lexical_stats
+from app.model.chatmodel import model_routes
+from app.store.response_cache import response_cache
+from app.store.user_profile import profile_service
 import asyncio
 
 
@@ -19,11 +28,15 @@ from .graph.chat_naming_graph import create_graph as create_summarizer_graph
 from .graph.test_graph import create_graph as create_test_graph
 
 from contextlib import asynccontextmanager
-from .agent_memory.db import init_memory
+from .agent_memory.db import init_memory, pool_stats
+from .agent_memory.retention import run_retention, stats as retention_stats
+from .store.data import warm_up as warm_up_knowledge_base, reload_vector_store
+from .agents.summary_agent import thread_lock, schedule_summary
+from .agents.memory_agent import schedule_profile_extraction
 
 from langchain.schema import HumanMessage, AIMessage
 
-import os,json,gzip
+import os,json,gzip,secrets
 
 
 
@@ -37,25 +50,76 @@ class ChatForm(BaseModel):
     gender: str
     conditions: str | None = None
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Tables are created and changed by Alembic migrations: alembic upgrade head
+
+_transcript_tasks = set()
+
+
+async def record_transcript(graph, config, completed):
+    """Copy a turn's user-visible messages from the checkpoint to the transcript served by GET /api/chat/{chat_id}.
+
+    Only a completed turn moves the chat up the chat list.
+    """
+    chat_id = config["configurable"]["thread_id"]
+    try:
+        state = await graph.aget_state(config)
+        async with AsyncSessionLocal() as session:
+            await sync_chat_messages(session, chat_id, state.values.get("messages", []))
+            if completed:
+                await touch_chat(session, chat_id)
+    except Exception as e:
+        print(f"Error appending to the transcript: {e}")
+
+
+class TurnTranscript:
+    """Wraps the stream of a turn; on exit, record_transcript runs in a task.
+
+    As a task it also runs when a client disconnect cancelled the stream, so
+    whatever the turn wrote to the checkpoint still reaches the transcript.
+    """
+
+    def __init__(self, graph, config):
+        self.graph = graph
+        self.config = config
+        self.task = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.task = asyncio.create_task(record_transcript(self.graph, self.config, completed=exc_type is None))
+        _transcript_tasks.add(self.task)
+        self.task.add_done_callback(_transcript_tasks.discard)
+        return False
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     
-    store, checkpointer, store_ctx, checkpointer_ctx = await init_memory()
+    store, checkpointer, pool = await init_memory()
     await store.setup()
     await checkpointer.setup()
+    app.state.pool = pool
     app.state.store = store
     app.state.checkpointer = checkpointer
     app.state.graph = create_graph(store, checkpointer)
     # app.state.graph = create_test_graph(checkpointer)
     app.state.summarizer_graph = create_summarizer_graph()
+    if KB_WARM_ON_STARTUP:
+        await asyncio.to_thread(warm_up_knowledge_base)
+    try:
+        purged = await asyncio.to_thread(response_cache.purge_stale)
+        print(f"Purged {purged} stale response cache entries")
+    except Exception as e:
+        print(f"Response cache purge failed: {e}")
+    retention_task = None
+    if CHECKPOINT_RETENTION_INTERVAL > 0:
+        retention_task = asyncio.create_task(run_retention(pool))
 
     yield
 
-    await store_ctx.__aexit__(None, None, None)
-    await checkpointer_ctx.__aexit__(None, None, None)
+    if retention_task is not None:
+        retention_task.cancel()
+    await pool.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -80,13 +144,65 @@ def health_check():
     )
 
 
+@app.get("/api/metrics")
+def metrics():
+    data = {
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "relevance_gate": relevance_gate.stats(),
+        "lexical_fast_path": lexical_stats(),
+        "models": model_routes(),
+        "response_cache": response_cache.stats(),
+        "user_profiles": profile_service.stats(),
+        "db_pool": pool_stats(app.state.pool),
+        "sql_engine_pool": engine_pool_stats(),
+        "sql_async_engine_pool": engine_pool_stats(async_engine),
+        "checkpoint_retention": retention_stats(),
+    }
+    compressed = gzip.compress(json.dumps(data).encode('utf-8'))
+    return Response(
+        content=compressed,
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip"}
+    )
+
+
+def require_admin(request: Request):
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+
+@app.post("/api/admin/reload-knowledge-base", dependencies=[Depends(require_admin)])
+async def reload_knowledge_base(rebuild: bool = False):
+    version = await asyncio.to_thread(reload_vector_store, rebuild)
+    data = {"status": "ok", "version": version}
+    compressed = gzip.compress(json.dumps(data).encode('utf-8'))
+    return Response(
+        content=compressed,
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip"}
+    )
+
+
+@app.post("/api/admin/invalidate-response-cache", dependencies=[Depends(require_admin)])
+async def invalidate_response_cache(tool: str | None = None):
+    deleted = await asyncio.to_thread(response_cache.invalidate, tool)
+    data = {"status": "ok", "deleted": deleted}
+    compressed = gzip.compress(json.dumps(data).encode('utf-8'))
+    return Response(
+        content=compressed,
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip"}
+    )
+
+
 
 @app.post("/api/new-chat")
-def create_chat(
+async def create_chat(
     request: Request,
     form: ChatForm,
     is_public: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     user_id = request.cookies.get("userId")
     is_new_user = user_id is None
@@ -94,22 +210,17 @@ def create_chat(
     if is_new_user:
         user_id = str(uuid4())
 
-    namespace = ("user_profile", user_id)
-    key = "user_details"
     value = UserProfile(
         user_name=form.name,
         age=int(form.age),
         gender=form.gender,
         conditions=form.conditions.split(",") if form.conditions else []
     )
-    app.state.store.put(namespace, key, value.model_dump())
-
-    for m in app.state.store.search(namespace):
-        print(m.dict())
+    await profile_service.aput(app.state.store, user_id, value.model_dump(mode="json"))
 
     chat_id = str(uuid4())
 
-    chat = create_chat_record(
+    chat = await create_chat_record(
         db,
         user_id=user_id,
         chat_id=chat_id,
@@ -153,7 +264,12 @@ def create_chat(
 
 
 @app.get("/api/user-chats")
-def get_user_chats(request: Request, db: Session = Depends(get_db)):
+async def get_user_chats(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=200),
+    before: str | None = None,
+    db: AsyncSession = Depends(get_db),
+):
     user_id = request.cookies.get("userId")
     if not user_id:
         # Return gzipped empty response
@@ -165,7 +281,10 @@ def get_user_chats(request: Request, db: Session = Depends(get_db)):
             headers={"Content-Encoding": "gzip"}
         )
 
-    chats = get_chats_by_user_id(db, user_id=user_id)
+    try:
+        chats, next_cursor = await get_chats_by_user_id(db, user_id=user_id, limit=limit, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     response_data = {
         "chats": [
@@ -178,7 +297,8 @@ def get_user_chats(request: Request, db: Session = Depends(get_db)):
                 }
             }
             for chat in chats
-        ]
+        ],
+        "next_cursor": next_cursor,
     }
 
     json_data = json.dumps(response_data).encode("utf-8")
@@ -195,7 +315,7 @@ def get_user_chats(request: Request, db: Session = Depends(get_db)):
 async def chat_endpoint(
     request: Request,
     body: dict = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     user_id = body.get("user_id")  # <-- get user_id from body now
     if not user_id:
@@ -213,7 +333,7 @@ async def chat_endpoint(
     if not chat_id or not message:
         return JSONResponse(status_code=400, content={"error": "Invalid request"})
 
-    chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
+    chat = await get_chat(db, chat_id)
     if not chat:
         return JSONResponse(status_code=404, content={"error": "Chat not found"})
     if chat.user_id != user_id:
@@ -232,65 +352,88 @@ async def chat_endpoint(
         return JSONResponse(status_code=500, content={"error": "Graph not initialized"})
 
     async def event_generator():
-        async for event in graph.astream_events(
-            # Command(resume="go to step 3!"),
+        # Held for the whole turn so a background summary is never committed mid-run
+        async with thread_lock(chat_id), TurnTranscript(graph, config) as transcript:
+            async for event in graph.astream_events(
+                # Command(resume="go to step 3!"),
             
-            {"messages": [HumanMessage(content=message)],"summary":""},
-            config=config,
-            version="v2",
-        ):
-            if event["metadata"].get('langgraph_node', '') == "tools" and event["event"]=="on_tool_start" and event["name"] == "retrieve": 
-
-                print(event["name"])
-                yield json.dumps({
-                    "type": "tool",
-                    "content": "retrieving documents...",
-                }) + "\n"
-                await asyncio.sleep(0.01)
-            elif event["event"] == "on_tool_start" and event["name"] == "check_documents":
-                print(event["name"])
-                yield json.dumps({
-                    "type": "tool",
-                    "content": "checking documents...",
-                }) + "\n"
-                await asyncio.sleep(0.01)
+                {"messages": [HumanMessage(content=message)]},
+                config=config,
+                version="v2",
+            ):
+                if event["metadata"].get('langgraph_node', '') == "tools" and event["event"]=="on_tool_start" and event["name"] in ("retrieve", "retrieve_many"): 
+
+                    print(event["name"])
+                    yield json.dumps({
+                        "type": "tool",
+                        "content": "retrieving documents...",
+                    }) + "\n"
+                    await asyncio.sleep(0.01)
+                elif event["event"] == "on_chain_start" and event["name"] == "symptom_worker":
+                    print(event["name"])
+                    yield json.dumps({
+                        "type": "tool",
+                        "content": f"retrieving documents for {event['data']['input']['symptom']}...",
+                    }) + "\n"
+                    await asyncio.sleep(0.01)
+                elif event["event"] == "on_tool_start" and event["name"] == "check_documents":
+                    print(event["name"])
+                    yield json.dumps({
+                        "type": "tool",
+                        "content": "checking documents...",
+                    }) + "\n"
+                    await asyncio.sleep(0.01)
             
-            elif event["event"] == "on_tool_start" and event["name"] == "diagnose_condition":
-                print(event["name"])
-                yield json.dumps({
-                    "type": "tool",
-                    "content": "consulting diagnostic agent...",
-                }) + "\n"
-                await asyncio.sleep(0.01)
+                elif event["event"] == "on_tool_start" and event["name"] == "diagnose_condition":
+                    print(event["name"])
+                    yield json.dumps({
+                        "type": "tool",
+                        "content": "consulting diagnostic agent...",
+                    }) + "\n"
+                    await asyncio.sleep(0.01)
             
-            elif event["event"] == "on_tool_start" and event["name"] == "explain_diagnosis":
-                print(event["name"])
-                yield json.dumps({
-                    "type": "tool",
-                    "content": "consulting explanation agent...",
-                }) + "\n"
-                await asyncio.sleep(0.01)
+                elif event["event"] == "on_tool_start" and event["name"] == "explain_diagnosis":
+                    print(event["name"])
+                    yield json.dumps({
+                        "type": "tool",
+                        "content": "consulting explanation agent...",
+                    }) + "\n"
+                    await asyncio.sleep(0.01)
             
-            elif event["event"] == "on_tool_start" and event["name"] == "recommend_treatment":
-                print(event["name"])
-                yield json.dumps({
-                    "type": "tool",
-                    "content": "consulting recommendation agent...",
-                }) + "\n"
-                await asyncio.sleep(0.01)
+                elif event["event"] == "on_tool_start" and event["name"] == "recommend_treatment":
+                    print(event["name"])
+                    yield json.dumps({
+                        "type": "tool",
+                        "content": "consulting recommendation agent...",
+                    }) + "\n"
+                    await asyncio.sleep(0.01)
                
             
-            elif event["event"] == "on_chat_model_stream" and event['metadata'].get('langgraph_node', '') == "supervisor":
-                data = event["data"]
-                print(data["chunk"].content)
-                yield json.dumps({
-                    "type": "ai",
-                    "content": data["chunk"].content
-                }) + "\n"
+                elif event["event"] == "on_chain_end" and event["name"] == "ask_question":
+                    # Follow-up questions come from the knowledge base, not from a streamed LLM call
+                    for msg in event["data"]["output"]["messages"]:
+                        yield json.dumps({
+                            "type": "ai",
+                            "content": msg.content
+                        }) + "\n"
+                    await asyncio.sleep(0.01)
+
+                elif event["event"] == "on_chat_model_stream" and event['metadata'].get('langgraph_node', '') == "supervisor":
+                    data = event["data"]
+                    print(data["chunk"].content)
+                    yield json.dumps({
+                        "type": "ai",
+                        "content": data["chunk"].content
+                    }) + "\n"
                 
-                await asyncio.sleep(0.01)
+                    await asyncio.sleep(0.01)
 
-            
+
+        # Off the critical path: the next turn picks the summary up from the checkpoint
+        schedule_summary(graph, config)
+        schedule_profile_extraction(graph, config, message)
+
+        await transcript.task
         state = await graph.aget_state(config)
         messages = state.values.get('messages', [])
 
@@ -329,11 +472,10 @@ async def chat_endpoint(
             print(f"Chat name generated: {chat_name}")
 
             if chat_name:
-                chat.chat_name = chat_name
                 try:
-                   updated_chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
-                   updated_chat.chat_name = chat_name
-                   db.commit()
+                   # Own session: the request's session is closed once the stream has started
+                   async with AsyncSessionLocal() as session:
+                       await rename_chat(session, chat_id, chat_name)
                 except Exception as e:
                    print(f"Error updating chat name: {e}")
 
@@ -347,8 +489,14 @@ async def chat_endpoint(
 
 
 @app.get("/api/chat/{chat_id}")
-def get_chat_by_id(chat_id: str, request: Request, db: Session = Depends(get_db)):
-    chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
+async def get_chat_by_id(
+    chat_id: str,
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=500),
+    before: int | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    chat = await get_chat(db, chat_id)
     
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
@@ -361,39 +509,19 @@ def get_chat_by_id(chat_id: str, request: Request, db: Session = Depends(get_db)
         if str(chat.user_id) != str(user_id):
             raise HTTPException(status_code=403, detail="Access denied")
     
-    graph = app.state.graph
-    thread = {"configurable": {"thread_id": chat.chat_id}}
-    state = graph.get_state(thread)
-
-    if "messages" not in state.values:
-        response_data = {
-            "id": chat.chat_id,
-            "messages": [],
-            "visibility": "public" if chat.is_public else "private"
-        }
-    else:
-        messages = state.values['messages']
-        typed_messages = []
-
-        for msg in messages:
-            if isinstance(msg, HumanMessage):
-                typed_messages.append({
-                    'role': 'user',
-                    'content': msg.content
-                })
-            elif isinstance(msg, AIMessage):
-                finish_reason = msg.response_metadata.get('finish_reason')
-                if finish_reason == 'stop':
-                    typed_messages.append({
-                        'role': 'ai',
-                        'content': msg.content
-                    })
-
-        response_data = {
-            "id": chat.chat_id,
-            "messages": typed_messages,
-            "visibility": "public" if chat.is_public else "private"
-        }
+    messages, next_cursor = await get_chat_messages(db, chat.chat_id, limit=limit, before=before)
+    if not messages and before is None:
+        # Chats from before the transcript table: copy the checkpoint's messages over once
+        state = await app.state.graph.aget_state({"configurable": {"thread_id": chat.chat_id}})
+        await append_chat_messages(db, chat.chat_id, visible_messages(state.values.get("messages", [])))
+        messages, next_cursor = await get_chat_messages(db, chat.chat_id, limit=limit)
+
+    response_data = {
+        "id": chat.chat_id,
+        "messages": [{"id": msg.id, "role": msg.role, "content": msg.content} for msg in messages],
+        "next_cursor": next_cursor,
+        "visibility": "public" if chat.is_public else "private"
+    }
 
     # Compress the response
     json_data = json.dumps(response_data).encode("utf-8")
@@ -406,25 +534,24 @@ def get_chat_by_id(chat_id: str, request: Request, db: Session = Depends(get_db)
     )
 
 @app.patch("/api/chat/{chat_id}/visibility")
-def update_chat_visibility(
+async def update_chat_visibility(
     chat_id: str = Path(...),
     is_public: bool = Body(..., embed=True),
     request: Request = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     user_id = request.cookies.get("userId")
     if not user_id:
         raise HTTPException(status_code=401, detail="User not authenticated")
 
-    chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
+    chat = await get_chat(db, chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
     if str(chat.user_id) != str(user_id):
         raise HTTPException(status_code=403, detail="Access denied")
 
-    chat.is_public = is_public
-    db.commit()
+    await set_chat_visibility(db, chat, is_public)
 
     response_data = {"chat_id": chat_id, "is_public": chat.is_public}
     compressed = gzip.compress(json.dumps(response_data).encode("utf-8"))
@@ -438,18 +565,17 @@ def update_chat_visibility(
 
 
 @app.get("/api/user-profile")
-def get_user_profile(request: Request):
+async def get_user_profile(request: Request):
     user_id = request.cookies.get("userId")
     if not user_id:
         raise HTTPException(status_code=401, detail="User not authenticated")
     
-    namespace_for_memory = ("user_profile", user_id)
-    user_profile = app.state.store.get(namespace_for_memory, "user_details")
+    user_profile = await profile_service.aget(app.state.store, user_id)
     if not user_profile:
         raise HTTPException(status_code=404, detail="User profile not found")
 
     # Compress the response
-    json_data = json.dumps(user_profile.value).encode("utf-8")
+    json_data = json.dumps(user_profile).encode("utf-8")
     compressed = gzip.compress(json_data)
 
     return Response(
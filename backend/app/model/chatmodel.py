@@ -1,3 +1,42 @@
+import os
+import threading
+
 from langchain_openai import ChatOpenAI
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
\ No newline at end of file
+from app.config import MODEL_TIERS
+
+# Tier each agent role runs on. Override per environment with
+# MODEL_ROLE_<ROLE>, set to a tier name or to a concrete model name.
+ROLE_TIERS = {
+    "supervisor": "strong",
+    "diagnosis": "strong",
+    "explanation": "strong",
+    "recommendation": "strong",
+    "evaluator": "fast",
+    "summarizer": "fast",
+    "memory": "fast",
+    "chat_naming": "fast",
+}
+
+_models = {}
+_lock = threading.Lock()
+
+
+def model_name(role):
+    choice = os.getenv(f"MODEL_ROLE_{role.upper()}") or ROLE_TIERS.get(role, "strong")
+    return MODEL_TIERS.get(choice, choice)
+
+def get_llm(role):
+    """Chat model for an agent role; roles resolving to the same model share one client."""
+    name = model_name(role)
+    with _lock:
+        if name not in _models:
+            _models[name] = ChatOpenAI(model=name, temperature=0)
+        return _models[name]
+
+def model_routes():
+    return {role: model_name(role) for role in ROLE_TIERS}
+
+
+# Default model, for code that is not tied to an agent role
+llm = get_llm("supervisor")
@@ -1,13 +1,62 @@
-from sqlalchemy import Column, String, Boolean, JSON, DateTime, func
+from sqlalchemy import (
+    Column, String, Boolean, JSON, DateTime, LargeBinary, Text, Float, BigInteger, ForeignKey, Index, UniqueConstraint, func,
+)
 from sqlalchemy.ext.mutable import MutableDict
 from .db import Base
 
 class Chat(Base):
     __tablename__ = "chats"
+    # The chat list is ordered by activity, newest first
+    __table_args__ = (Index("ix_chats_user_id_updated_at", "user_id", "updated_at"),)
 
     chat_id = Column(String, primary_key=True, index=True)
     user_id = Column(String, index=True)
     is_public = Column(Boolean, default=False)
     chat_name = Column(String, nullable=False, default="Untitled")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Last activity: only touch_chat() (a completed turn) moves it, not renames or visibility changes
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ChatMessage(Base):
+    """User-visible transcript of a chat (user messages and final AI answers), appended after each turn.
+
+    The auto-increment id orders a chat's messages and is the pagination cursor
+    of GET /api/chat/{chat_id}, so the history never needs a checkpoint decode.
+    """
+    __tablename__ = "chat_messages"
+    __table_args__ = (
+        UniqueConstraint("chat_id", "message_id", name="uq_chat_messages_chat_message"),
+        Index("ix_chat_messages_chat_id_id", "chat_id", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    chat_id = Column(String, ForeignKey("chats.chat_id", ondelete="CASCADE"), nullable=False)
+    # Id of the LangGraph message, so re-appending a turn is a no-op
+    message_id = Column(String, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class QueryEmbedding(Base):
+    """Shared query-embedding cache tier, keyed by embedding model and normalized query."""
+    __tablename__ = "query_embeddings"
+
+    model = Column(String, primary_key=True)
+    query = Column(String, primary_key=True)
+    vector = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ResponseCacheEntry(Base):
+    """Shared tier of the diagnose/explain/recommend response cache, keyed by a hash of the canonical inputs."""
+    __tablename__ = "response_cache"
+
+    key = Column(String(64), primary_key=True)
+    tool = Column(String, nullable=False, index=True)
+    model = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    latency_ms = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,168 @@
+"""Retrieval benchmark across index types and corpus sizes.
+
+Builds synthetic symptom corpora at several scales, embeds them with the
+deterministic local HashingEmbeddings, and compares the index types that
+KB_INDEX_TYPE can select in app/store/data.py. For each (size, index type) it
+reports build time, index memory, single-query p50/p99 latency and recall@3
+against the flat (exact) baseline, and writes the results as JSON.
+
+    python -m app.store.benchmark --sizes 1000 10000 100000 --out bench_results.json
+
+With --kb it also times get_vector_store() and the retrieve tool's search
+path on the configured knowledge base.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+
+import faiss
+import numpy as np
+
+from .data import make_index
+from .embeddings import HashingEmbeddings
+
+INDEX_TYPES = ["flat", "hnsw", "ivfpq"]
+
+VOCABULARY = [
+    "acute", "chronic", "persistent", "severe", "mild", "recurrent", "sudden", "intermittent",
+    "left", "right", "upper", "lower", "nocturnal", "morning", "exertional", "radiating",
+    "pain", "ache", "swelling", "numbness", "tingling", "weakness", "stiffness", "itching",
+    "rash", "cough", "fever", "fatigue", "nausea", "vomiting", "dizziness", "bleeding",
+    "headache", "chest", "abdominal", "joint", "back", "neck", "throat", "eye", "ear",
+    "skin", "leg", "arm", "hand", "foot", "knee", "shoulder", "hip", "jaw", "breathing",
+    "swallowing", "urination", "vision", "hearing", "memory", "sleep", "appetite", "weight",
+]
+
+
+def synthetic_corpus(size, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(2, 6, size=size)
+    return [" ".join(rng.choice(VOCABULARY, size=n)) for n in lengths]
+
+
+def perturbed_queries(corpus, count, seed=1):
+    """Corpus entries with one word dropped or swapped, like a rewritten user symptom."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for text in rng.choice(corpus, size=count):
+        words = text.split()
+        i = rng.integers(len(words))
+        if len(words) > 2 and rng.random() < 0.5:
+            words.pop(i)
+        else:
+            words[i] = rng.choice(VOCABULARY)
+        queries.append(" ".join(words))
+    return queries
+
+
+def latency_percentiles(index, queries, k):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1e3
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def bench_index_types(sizes, index_types, queries_per_size, k=3, embeddings=None):
+    embeddings = embeddings or HashingEmbeddings()
+    results = []
+    for size in sizes:
+        corpus = synthetic_corpus(size)
+        start = time.perf_counter()
+        vectors = embeddings.embed_array(corpus)
+        embed_seconds = time.perf_counter() - start
+        queries = embeddings.embed_array(perturbed_queries(corpus, queries_per_size))
+        print(f"📚 {size} rows embedded in {embed_seconds:.2f}s")
+
+        truth = None
+        for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+            start = time.perf_counter()
+            index = make_index(vectors, index_type)
+            build_seconds = time.perf_counter() - start
+
+            _, found = index.search(queries, k)
+            if truth is None:
+                truth = found
+            p50, p99 = latency_percentiles(index, queries, k)
+
+            result = {
+                "corpus_size": size,
+                "index_type": index_type,
+                "built_as": type(index).__name__,
+                "build_seconds": round(build_seconds, 4),
+                "index_bytes": len(faiss.serialize_index(index)),
+                "query_p50_ms": round(p50, 4),
+                "query_p99_ms": round(p99, 4),
+                f"recall_at_{k}": round(recall_at_k(found, truth, k), 4),
+            }
+            results.append(result)
+            print(
+                f"  {index_type:6} build {build_seconds:8.3f}s  "
+                f"mem {result['index_bytes'] / 2**20:8.2f}MiB  "
+                f"p50 {p50:7.3f}ms  p99 {p99:7.3f}ms  recall@{k} {result[f'recall_at_{k}']:.3f}"
+            )
+    return results
+
+
+def bench_knowledge_base(k=3):
+    """Time the real load and retrieve search path on the configured knowledge base."""
+    from . import data
+    from app.agents.retriever import search_symptoms
+
+    start = time.perf_counter()
+    vector_store = data.get_vector_store()
+    load_seconds = time.perf_counter() - start
+
+    symptoms = [vector_store.document(p).page_content for p in range(len(vector_store))]
+    lexical_queries = symptoms
+    vector_queries = perturbed_queries(symptoms, len(symptoms))
+
+    report = {"load_seconds": round(load_seconds, 4), "rows": len(vector_store), "meta": vector_store.meta}
+    for name, queries in [("lexical", lexical_queries), ("vector", vector_queries)]:
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search_symptoms([query], k=k)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1e3
+        report[f"{name}_p50_ms"] = round(float(np.percentile(timings, 50)), 4)
+        report[f"{name}_p99_ms"] = round(float(np.percentile(timings, 99)), 4)
+    print(f"🩺 knowledge base: {json.dumps(report, default=str)}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--index-types", nargs="+", default=INDEX_TYPES, choices=INDEX_TYPES)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--kb", action="store_true", help="also benchmark the configured knowledge base")
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    embeddings = HashingEmbeddings()
+    output = {
+        "embedding_provider": embeddings.provider_id,
+        "faiss_version": faiss.__version__,
+        "python": platform.python_version(),
+        "results": bench_index_types(args.sizes, args.index_types, args.queries, embeddings=embeddings),
+    }
+    if args.kb:
+        output["knowledge_base"] = bench_knowledge_base()
+
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2, default=str)
+    print(f"💾 Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,68 +1,483 @@
 import os
-import pandas as pd
+import sys
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import faiss
 import numpy as np
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.schema import Document
 from dotenv import load_dotenv
 
+from .mapped_store import MappedVectorStore, StoreWriter, read_meta
+from .embeddings import create_embeddings, embedding_provider_id
+
 load_dotenv(override=True)
 
+# Every build is published as a new version directory under KB_DIR; the
+# CURRENT file names the live one and is replaced atomically.
+KB_DIR = "app/store/kb"
+CURRENT_FILE = os.path.join(KB_DIR, "CURRENT")
+# Held (flock) by whoever builds or publishes a version; every build stages
+# into its own build-* directory
+BUILD_LOCK_FILE = os.path.join(KB_DIR, "build.lock")
+BUILD_PREFIX = "build-"
+# Published versions kept on disk (the live one included)
+KEEP_VERSIONS = int(os.getenv("KB_KEEP_VERSIONS", "3"))
+# Seconds a replaced version stays on disk, so workers that just read CURRENT can still open it
+PRUNE_GRACE = float(os.getenv("KB_PRUNE_GRACE", "600"))
+# Seconds between checks of CURRENT by get_vector_store(); 0 disables them
+WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "5"))
+# Pickled LangChain index, only read once to migrate to KB_DIR
+LEGACY_INDEX_FILE = "app/store/faiss_cosine_index"
+SOURCE_FILE = "symptoms_data.csv"
+# Row-hash -> embedding caches, one file per embedding provider
+EMBEDDING_CACHE_DIR = "app/store/embedding_cache"
+# Provider the legacy index was built with (LangChain's OpenAIEmbeddings default)
+LEGACY_EMBEDDING_PROVIDER = "openai:text-embedding-ada-002"
+
+# "load" only builds when no index exists, "incremental" re-syncs the index
+# with the CSV on startup (embedding only new/changed rows), "full" rebuilds.
+BUILD_MODE = os.getenv("KB_BUILD_MODE", "load")
+
+# Index structure: "flat" (exact, brute force), "hnsw" (graph) or "ivfpq"
+# (inverted lists + product quantization). See app/store/benchmark.py for
+# build time, memory, latency and recall@3 of each at different corpus sizes.
+INDEX_TYPE = os.getenv("KB_INDEX_TYPE", "flat")
+HNSW_M = int(os.getenv("KB_HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("KB_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("KB_IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("KB_PQ_M", "16"))
+
+
 def parse_questions(q):
     return [x.strip() for x in str(q).split(";")]
 
-def normalize_embeddings(embeddings):
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    return embeddings / norms
+def row_hash(symptom, conditions, follow_up_questions):
+    """Content hash of a knowledge-base row, used as its document id."""
+    payload = "\x1f".join([str(symptom).strip(), str(conditions).strip(), *follow_up_questions])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-def get_vector_store():
-    INDEX_FILE = "app/store/faiss_cosine_index"
-    df = pd.read_csv("symptoms_data.csv")
-    embeddings = OpenAIEmbeddings()
+def document_hash(doc):
+    return row_hash(
+        doc.page_content,
+        doc.metadata.get("conditions", ""),
+        doc.metadata.get("follow_up_questions", []),
+    )
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def row_to_document(row):
+    return Document(
+        page_content=row["symptom"],
+        metadata={
+            "conditions": row["conditions"],
+            "follow_up_questions": parse_questions(row["follow_up_questions"])
+        }
+    )
+
+def load_documents(path=SOURCE_FILE):
+    import pandas as pd
+
+    df = pd.read_csv(path)
 
     # Convert CSV to Document list
-    docs = [
-        Document(
-            page_content=row["symptom"],
-            metadata={
-                "conditions": row["conditions"],
-                "follow_up_questions": parse_questions(row["follow_up_questions"])
-            }
-        )
-        for _, row in df.iterrows()
-    ]
+    return [row_to_document(row) for _, row in df.iterrows()]
 
-    if os.path.exists(INDEX_FILE):
-        print("🔄 Loading existing FAISS index...")
-        vector_store = FAISS.load_local(INDEX_FILE, embeddings, allow_dangerous_deserialization=True)
-    else:
-        print("🆕 Creating FAISS index using cosine similarity...")
-        dim = len(embeddings.embed_query("test"))
+
+class EmbeddingCache:
+    """Row-hash -> document embedding, persisted next to the index.
+
+    Embeddings are kept for rows that are later removed from the CSV, so
+    restoring a row (or rebuilding the index from scratch) costs no API calls.
+    """
+
+    def __init__(self, provider_id=None):
+        provider_id = provider_id or embedding_provider_id()
+        self.path = os.path.join(EMBEDDING_CACHE_DIR, provider_id.replace(":", "_").replace("/", "_") + ".npz")
+        self.vectors = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            with np.load(self.path, allow_pickle=False) as data:
+                for h, vector in zip(data["hashes"], data["vectors"]):
+                    self.vectors[str(h)] = vector
+
+    def __contains__(self, h):
+        return h in self.vectors
+
+    def __getitem__(self, h):
+        return self.vectors[h]
+
+    def put(self, h, vector):
+        self.vectors[h] = np.asarray(vector, dtype=np.float32)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        hashes = np.array(list(self.vectors.keys()))
+        vectors = np.stack(list(self.vectors.values())).astype(np.float32)
+        os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, hashes=hashes, vectors=vectors)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def make_index(vectors, index_type=INDEX_TYPE, block_size=65536, max_train=100_000):
+    """Build and fill an inner-product (cosine on normalized vectors) index.
+
+    `vectors` may be a memory-mapped array: IVF-PQ trains on an evenly spaced
+    sample and rows are added in blocks, so the corpus never has to be
+    resident in memory at once.
+    """
+    n, dim = vectors.shape
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == "ivfpq":
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        pq_m = PQ_M if dim % PQ_M == 0 else 1
+        if n < max(256, nlist * 39):
+            # PQ codebooks need at least 256 training points
+            print(f"⚠️ {n} rows are too few to train IVF-PQ, using a flat index.")
+            return make_index(vectors, "flat")
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+        sample = vectors[np.linspace(0, n - 1, min(n, max_train)).astype(np.int64)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        index.nprobe = min(IVF_NPROBE, nlist)
+    elif index_type == "flat":
         index = faiss.IndexFlatIP(dim)  # Use inner product for cosine similarity
+    else:
+        raise ValueError(f"Unknown KB_INDEX_TYPE: {index_type}")
 
-    
-        class NormalizedOpenAIEmbeddings(OpenAIEmbeddings):
-            def embed_documents(self, texts):
-                raw = super().embed_documents(texts)
-                return normalize_embeddings(np.array(raw)).tolist()
+    for start in range(0, n, block_size):
+        index.add(np.ascontiguousarray(vectors[start:start + block_size], dtype=np.float32))
+    return index
 
-            def embed_query(self, text):
-                raw = super().embed_query(text)
-                return (np.array(raw) / np.linalg.norm(raw)).tolist()
+def convert_legacy_index():
+    """One-time migration of the pickled LangChain index to the mapped format."""
+    from langchain_community.vectorstores import FAISS
 
-        normalized_embeddings = NormalizedOpenAIEmbeddings()
+    print("🔁 Converting legacy FAISS index to the memory-mapped format...")
+    legacy = FAISS.load_local(LEGACY_INDEX_FILE, get_embeddings(), allow_dangerous_deserialization=True)
+    positions = sorted(legacy.index_to_docstore_id)
+    documents = [legacy.docstore.search(legacy.index_to_docstore_id[p]) for p in positions]
+    vectors = np.stack([legacy.index.reconstruct(p) for p in positions])
 
-        vector_store = FAISS(
-            embedding_function=normalized_embeddings,
-            index=index,
-            docstore=InMemoryDocstore(),
-            index_to_docstore_id={}
+    cache = EmbeddingCache(LEGACY_EMBEDDING_PROVIDER)
+    ids = []
+    for doc, vector in zip(documents, vectors):
+        h = document_hash(doc)
+        ids.append(h)
+        if h not in cache:
+            cache.put(h, vector)
+    cache.save()
+
+    with build_lock(), staging_dir() as staging:
+        writer = StoreWriter(staging)
+        writer.append(ids, documents, vectors)
+        writer.finish(
+            lambda v: make_index(v, "flat"),
+            meta={"embedding_provider": LEGACY_EMBEDDING_PROVIDER},
         )
+        writer.discard_logs()
+        return MappedVectorStore(publish_version(staging))
+
+
+def build_vector_store(incremental=True):
+    """Sync the index with the CSV.
+
+    Every row is identified by its content hash. In incremental mode only rows
+    whose hash is not yet in the index are embedded (through the embedding
+    cache), and rows that disappeared from the CSV are tombstoned: dropped from
+    the index while their embedding stays cached.
+
+    Runs under the build lock, so concurrent builds by other workers or the
+    CLI wait for this one instead of racing it.
+    """
+    with build_lock():
+        return _build_vector_store(incremental)
+
+
+def _build_vector_store(incremental):
+    provider = embedding_provider_id()
+
+    vector_store = None
+    current_dir = current_version_dir()
+    if incremental and current_dir is not None:
+        vector_store = MappedVectorStore(current_dir)
+    elif incremental and os.path.exists(LEGACY_INDEX_FILE) and provider == LEGACY_EMBEDDING_PROVIDER:
+        vector_store = convert_legacy_index()
+
+    if vector_store is not None and vector_store.meta.get("embedding_provider") != provider:
+        print(f"♻️ Index was built with {vector_store.meta.get('embedding_provider')}, rebuilding for {provider}...")
+        vector_store.close()
+        vector_store = None
+
+    if vector_store is not None and not os.path.exists(SOURCE_FILE):
+        print(f"⚠️ {SOURCE_FILE} not found, serving the existing index as is.")
+        return vector_store
+
+    source_hash = file_hash(SOURCE_FILE)
+    if (
+        vector_store is not None
+        and vector_store.meta.get("source_sha256") == source_hash
+        and vector_store.meta.get("requested_index_type", "flat") == INDEX_TYPE
+    ):
+        print("✅ FAISS index is up to date with the CSV.")
+        return vector_store
+
+    docs = load_documents()
+    current = {document_hash(doc): doc for doc in docs}
+    cache = EmbeddingCache()
+
+    existing = []
+    if vector_store is not None:
+        # Seed the cache from indexes built before the cache existed; PQ codes
+        # are lossy, so those rows are re-embedded instead
+        exact = vector_store.meta.get("index_type", "flat") != "ivfpq"
+        for position in range(len(vector_store)):
+            h = vector_store.doc_id(position)
+            existing.append(h)
+            if h not in cache and exact:
+                cache.put(h, vector_store.vector(position))
+        vector_store.close()
+
+    known = set(existing)
+    tombstoned = [h for h in existing if h not in current]
+    added = [h for h in current if h not in known]
+
+    # Surviving rows keep their position, new rows are appended
+    ids = [h for h in existing if h in current] + added
+
+    missing = [h for h in ids if h not in cache]
+    if missing:
+        print(f"🧮 Embedding {len(missing)} new or changed rows...")
+        vectors = get_embeddings().embed_documents([current[h].page_content for h in missing])
+        for h, vector in zip(missing, vectors):
+            cache.put(h, vector)
+
+    with staging_dir() as staging:
+        writer = StoreWriter(staging)
+        writer.append(ids, [current[h] for h in ids], np.stack([cache[h] for h in ids]))
+        writer.finish(
+            make_index,
+            meta={
+                "source_sha256": source_hash,
+                "embedding_provider": provider,
+                "requested_index_type": INDEX_TYPE,
+                "added": len(added),
+                "embedded": len(missing),
+                "tombstoned": len(tombstoned),
+            },
+        )
+        writer.discard_logs()
+        path = publish_version(staging)
+    cache.save()
+    print(f"💾 FAISS cosine index saved as {os.path.basename(path)} (+{len(added)} rows, {len(missing)} embedded, -{len(tombstoned)} tombstoned).")
+
+    return MappedVectorStore(path)
+
+
+def current_version():
+    """Name of the live index version, or None before the first build."""
+    try:
+        with open(CURRENT_FILE) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_version_dir():
+    version = current_version()
+    return os.path.join(KB_DIR, version) if version else None
+
+_build_thread_lock = threading.RLock()
+_build_lock_file = None
+
+@contextmanager
+def build_lock():
+    """Exclusive build/publish lock: an flock across processes, re-entrant within one."""
+    global _build_lock_file
+    with _build_thread_lock:
+        owner = _build_lock_file is None
+        if owner:
+            os.makedirs(KB_DIR, exist_ok=True)
+            f = open(BUILD_LOCK_FILE, "a")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            _build_lock_file = f
+        try:
+            yield
+        finally:
+            if owner:
+                _build_lock_file = None
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+
+@contextmanager
+def staging_dir():
+    """A fresh staging directory for one build, removed unless it was published."""
+    os.makedirs(KB_DIR, exist_ok=True)
+    # Left behind by builds that crashed; only the lock holder builds
+    for name in os.listdir(KB_DIR):
+        if name.startswith(BUILD_PREFIX):
+            shutil.rmtree(os.path.join(KB_DIR, name), ignore_errors=True)
+    path = tempfile.mkdtemp(prefix=BUILD_PREFIX, dir=KB_DIR)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def publish_version(staging_path):
+    """Move a finished index directory into KB_DIR as a new version and point CURRENT at it.
+
+    Processes that still have an older version open keep reading it: its
+    files stay valid until they are unmapped, even once pruned from disk.
+    A replaced version is only pruned PRUNE_GRACE seconds after it stopped
+    being CURRENT, so a worker that read CURRENT just before the switch can
+    still open it.
+    """
+    with build_lock():
+        version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        path = os.path.join(KB_DIR, version)
+        os.replace(staging_path, path)
+
+        previous = current_version_dir()
+        tmp_path = CURRENT_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, CURRENT_FILE)
+        if previous is not None and os.path.isdir(previous):
+            # Its mtime now records when it was replaced
+            os.utime(previous)
+
+        prune_versions(keep=version)
+    return path
+
+def prune_versions(keep):
+    """Remove versions beyond the newest KEEP_VERSIONS that were replaced more than PRUNE_GRACE seconds ago."""
+    versions = sorted(
+        name for name in os.listdir(KB_DIR)
+        if name[:1].isdigit() and os.path.isdir(os.path.join(KB_DIR, name))
+    )
+    now = time.time()
+    for name in versions[:-KEEP_VERSIONS or None]:
+        path = os.path.join(KB_DIR, name)
+        if name == keep or name == current_version():
+            continue
+        try:
+            if now - os.path.getmtime(path) < PRUNE_GRACE:
+                continue
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def check_embedding_provider(meta):
+    """Refuse to query an index with a different embedder than the one that built it."""
+    built_with = meta.get("embedding_provider")
+    if built_with != embedding_provider_id():
+        raise ValueError(
+            f"Index {current_version()} was built with embedding provider {built_with!r} but "
+            f"queries would use {embedding_provider_id()!r}; rebuild it with KB_BUILD_MODE=full."
+        )
+
+
+_embeddings = None
+_vector_store = None
+_checked_at = 0.0
+_lock = threading.RLock()
+_reload_lock = threading.Lock()
+
+def get_embeddings():
+    """Query/document embedder, created on first use."""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                _embeddings = create_embeddings()
+    return _embeddings
+
+def load_vector_store():
+    version = current_version()
+    if BUILD_MODE == "load" and version is not None:
+        return open_current_version()
+    with build_lock():
+        if current_version() != version:
+            # Another worker published a version while this one waited for the lock
+            return open_current_version()
+        return build_vector_store(incremental=BUILD_MODE != "full")
+
+def open_current_version():
+    # Warm start: the saved index is all we need, the CSV is not read
+    path = current_version_dir()
+    print(f"🔄 Loading FAISS index {os.path.basename(path)}...")
+    check_embedding_provider(read_meta(path))
+    return MappedVectorStore(path)
+
+def get_vector_store():
+    """Knowledge-base vector store, loaded (or built) on first use.
+
+    Callers get a snapshot: keep the returned store for the whole operation
+    and a concurrent reload cannot change it underneath. Every WATCH_INTERVAL
+    seconds CURRENT is checked, so a version published by another process
+    (a CLI build, ingest, another worker's reload) is picked up without a
+    restart. A replaced snapshot is freed once its last caller drops it.
+    """
+    global _vector_store, _checked_at
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                _vector_store = load_vector_store()
+                _checked_at = time.monotonic()
+    elif WATCH_INTERVAL and time.monotonic() - _checked_at > WATCH_INTERVAL:
+        _checked_at = time.monotonic()
+        version = current_version()
+        if version is not None and version != os.path.basename(_vector_store.path):
+            try:
+                reload_vector_store()
+            except Exception as e:
+                # Keep serving the snapshot we have; the next check retries
+                print(f"⚠️ Could not open knowledge base version {version}, still serving {os.path.basename(_vector_store.path)}: {e}")
+    return _vector_store
+
+def reload_vector_store(rebuild=False):
+    """Swap in the version CURRENT points to and return its name.
+
+    With rebuild=True the index is first synced with the CSV (embedding only
+    new rows) and published as a new version. Requests keep being served from
+    the old snapshot until the new one is open.
+    """
+    global _vector_store, _checked_at
+    with _reload_lock:
+        vector_store = build_vector_store(incremental=True) if rebuild else open_current_version()
+        with _lock:
+            _vector_store = vector_store
+            _checked_at = time.monotonic()
+    print(f"🔁 Knowledge base now serving {os.path.basename(vector_store.path)}.")
+    return os.path.basename(vector_store.path)
+
+def warm_up():
+    """Load the index and embedder ahead of the first request."""
+    get_vector_store()
+    get_embeddings()
 
-        vector_store.add_documents(docs)
-        vector_store.save_local(INDEX_FILE)
-        print("💾 FAISS cosine index saved.")
 
-    return vector_store
+if __name__ == "__main__":
+    # python -m app.store.data [--full]
+    build_vector_store(incremental="--full" not in sys.argv)
@@ -0,0 +1,128 @@
+import os
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from app.config import EMBEDDING_PROVIDER, OPENAI_EMBEDDING_MODEL, HASHING_EMBEDDING_DIM, EMBEDDING_MODEL_PATH
+
+
+def normalize_embeddings(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / norms
+
+
+class NormalizedOpenAIEmbeddings(OpenAIEmbeddings):
+    @property
+    def provider_id(self):
+        return f"openai:{self.model}"
+
+    def embed_documents(self, texts):
+        raw = super().embed_documents(texts)
+        return normalize_embeddings(np.array(raw)).tolist()
+
+    def embed_query(self, text):
+        raw = super().embed_query(text)
+        return (np.array(raw) / np.linalg.norm(raw)).tolist()
+
+
+class HashingEmbeddings(Embeddings):
+    """Local CPU embedder: signed hashed character n-grams, L2-normalized.
+
+    Deterministic and dependency-free, so indexes can be built and queried
+    without network access.
+    """
+
+    is_local = True
+
+    def __init__(self, dim=HASHING_EMBEDDING_DIM, ngram_range=(2, 4)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    @property
+    def provider_id(self):
+        return f"hashing:{self.dim}:{self.ngram_range[0]}-{self.ngram_range[1]}"
+
+    def _ngrams(self, text):
+        text = f" {' '.join(str(text).lower().split())} "
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(text) - n + 1):
+                yield text[i:i + n]
+
+    def embed_array(self, texts):
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for gram in self._ngrams(text):
+                h = zlib.crc32(gram.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)), np.array(signs, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+
+class LocalModelEmbeddings(Embeddings):
+    """sentence-transformers model loaded from a local path and run on CPU."""
+
+    is_local = True
+
+    def __init__(self, path=EMBEDDING_MODEL_PATH, batch_size=64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_PROVIDER=local requires the sentence-transformers package") from e
+        if not path:
+            raise ValueError("EMBEDDING_PROVIDER=local requires EMBEDDING_MODEL_PATH")
+
+        self.path = path
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(path, device="cpu")
+
+    @property
+    def provider_id(self):
+        return f"local:{os.path.basename(os.path.normpath(self.path))}"
+
+    def embed_array(self, texts):
+        return self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).astype(np.float32)
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+
+def create_embeddings(provider=EMBEDDING_PROVIDER):
+    if provider == "openai":
+        return NormalizedOpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL)
+    if provider == "hashing":
+        return HashingEmbeddings()
+    if provider == "local":
+        return LocalModelEmbeddings()
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider}")
+
+def embedding_provider_id(provider=EMBEDDING_PROVIDER):
+    """Id recorded in the index meta, resolved without constructing the embedder."""
+    if provider == "openai":
+        return f"openai:{OPENAI_EMBEDDING_MODEL}"
+    if provider == "hashing":
+        return HashingEmbeddings().provider_id
+    if provider == "local":
+        return f"local:{os.path.basename(os.path.normpath(EMBEDDING_MODEL_PATH))}"
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider}")
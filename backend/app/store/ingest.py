@@ -0,0 +1,178 @@
+"""Streaming, resumable knowledge-base ingestion.
+
+Reads the source CSV in chunks, embeds rows in bounded batches on a thread
+pool, appends them to a staging index directory and checkpoints after every
+chunk. An interrupted run picks up at the last checkpoint; a finished run is
+published as a new knowledge-base version, which
+running workers pick up without a restart.
+
+    python -m app.store.ingest --source symptoms_data.csv --chunk-size 2048 --batch-size 256 --concurrency 4
+"""
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .data import (
+    KB_DIR, SOURCE_FILE, INDEX_TYPE, EmbeddingCache,
+    row_to_document, document_hash, file_hash, get_embeddings, make_index, publish_version,
+)
+from .embeddings import embedding_provider_id
+from .mapped_store import StoreWriter, VECTORS_LOG, IDS_LOG, OFFSETS_LOG
+
+STAGING_DIR = os.path.join(KB_DIR, "ingest.tmp")
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+def read_checkpoint(path=STAGING_DIR):
+    checkpoint_path = os.path.join(path, CHECKPOINT_NAME)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        return json.load(f)
+
+def write_checkpoint(state, path=STAGING_DIR):
+    checkpoint_path = os.path.join(path, CHECKPOINT_NAME)
+    with open(checkpoint_path + ".tmp", "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def publish_staging():
+    for name in (VECTORS_LOG, IDS_LOG, OFFSETS_LOG, CHECKPOINT_NAME):
+        path = os.path.join(STAGING_DIR, name)
+        if os.path.exists(path):
+            os.remove(path)
+    return publish_version(STAGING_DIR)
+
+
+def seen_key(h):
+    """64-bit prefix of a row hash: the duplicate check keeps one int per row instead of the hex string."""
+    return int(h[:16], 16)
+
+
+def skip_records(chunks, count):
+    """The chunks of a CSV reader minus its first `count` parsed records.
+
+    Resuming counts parsed records, not lines: a quoted field may span
+    several lines, so skipping physical lines could start mid-record.
+    """
+    for chunk in chunks:
+        if count >= len(chunk):
+            count -= len(chunk)
+            continue
+        yield chunk.iloc[count:]
+        count = 0
+
+
+def embed_in_batches(texts, embeddings, batch_size, executor):
+    """Embed texts as concurrent embed_documents calls of at most batch_size texts, keeping order."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    return [vector for batch in executor.map(embeddings.embed_documents, batches) for vector in batch]
+
+
+def ingest(source=SOURCE_FILE, chunk_size=2048, batch_size=256, concurrency=4, use_cache=False, restart=False):
+    import pandas as pd
+
+    provider = embedding_provider_id()
+    source_hash = file_hash(source)
+
+    checkpoint = None if restart else read_checkpoint()
+    if checkpoint and (checkpoint["source_sha256"] != source_hash or checkpoint["embedding_provider"] != provider):
+        print("⚠️ Checkpoint belongs to a different source or embedding provider, starting over.")
+        checkpoint = None
+
+    if checkpoint and checkpoint.get("finished"):
+        print("📦 Previous run finished building, publishing it.")
+        publish_staging()
+        return
+
+    if checkpoint:
+        print(f"⏩ Resuming after {checkpoint['source_rows']} source rows ({checkpoint['rows']} indexed).")
+        writer = StoreWriter(STAGING_DIR, rows=checkpoint["rows"], dim=checkpoint["dim"])
+        source_rows = checkpoint["source_rows"]
+        seen = {seen_key(h) for h in writer.written_ids()}
+    else:
+        writer = StoreWriter(STAGING_DIR)
+        source_rows = 0
+        seen = set()
+
+    cache = EmbeddingCache() if use_cache else None
+    embeddings = get_embeddings()
+    reader = skip_records(pd.read_csv(source, chunksize=chunk_size), source_rows)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for chunk in reader:
+            rows = []
+            for _, row in chunk.iterrows():
+                doc = row_to_document(row)
+                h = document_hash(doc)
+                if seen_key(h) not in seen:
+                    seen.add(seen_key(h))
+                    rows.append((h, doc))
+
+            vectors = [cache[h] if cache is not None and h in cache else None for h, _ in rows]
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            fresh = embed_in_batches([rows[i][1].page_content for i in missing], embeddings, batch_size, executor)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+                if cache is not None:
+                    cache.put(rows[i][0], vectors[i])
+
+            if rows:
+                writer.append([h for h, _ in rows], [doc for _, doc in rows], np.stack(vectors))
+            source_rows += len(chunk)
+
+            writer.flush()
+            # Saved with every checkpoint so an interrupted run keeps the embeddings it paid for
+            if cache is not None:
+                cache.save()
+            write_checkpoint({
+                "source_sha256": source_hash,
+                "embedding_provider": provider,
+                "source_rows": source_rows,
+                "rows": writer.rows,
+                "dim": writer.dim,
+            })
+            print(f"🧮 {source_rows} source rows read, {writer.rows} indexed ({len(missing)} embedded in this chunk).")
+
+    writer.finish(make_index, meta={
+        "source_sha256": source_hash,
+        "embedding_provider": provider,
+        "requested_index_type": INDEX_TYPE,
+    })
+    write_checkpoint({**read_checkpoint(), "finished": True})
+    path = publish_staging()
+    print(f"💾 Ingested {writer.rows} rows into {path}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=SOURCE_FILE)
+    parser.add_argument("--chunk-size", type=int, default=2048, help="CSV rows read and checkpointed at a time")
+    parser.add_argument("--batch-size", type=int, default=256, help="texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    parser.add_argument(
+        "--cache", action="store_true",
+        help="reuse and extend the row-hash embedding cache; it is held in memory, so only for corpora that fit",
+    )
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start from the first row")
+    args = parser.parse_args(argv)
+
+    ingest(
+        source=args.source,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        use_cache=args.cache,
+        restart=args.restart,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
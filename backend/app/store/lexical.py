@@ -0,0 +1,74 @@
+import os
+import re
+import json
+import threading
+
+from app.config import SYMPTOM_ALIASES_FILE
+
+LEXICAL_NAME = "lexical.json"
+
+_non_word = re.compile(r"[^a-z0-9]+")
+
+stats = {"hits": 0, "misses": 0}
+
+
+def normalize_symptom(text):
+    return _non_word.sub(" ", str(text).lower()).strip()
+
+
+def load_aliases(path=SYMPTOM_ALIASES_FILE):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {normalize_symptom(alias): normalize_symptom(symptom) for alias, symptom in json.load(f).items()}
+
+_aliases = None
+_aliases_lock = threading.Lock()
+
+
+def get_aliases():
+    """The alias table, read on the first lookup instead of at import time."""
+    global _aliases
+    if _aliases is None:
+        with _aliases_lock:
+            if _aliases is None:
+                _aliases = load_aliases()
+    return _aliases
+
+
+def build_lexical_entries(symptoms):
+    """Normalized symptom -> index positions of the documents keyed on it."""
+    entries = {}
+    for position, symptom in enumerate(symptoms):
+        entries.setdefault(normalize_symptom(symptom), []).append(position)
+    return entries
+
+
+def write_lexical_entries(path, entries):
+    with open(os.path.join(path, LEXICAL_NAME), "w") as f:
+        json.dump(entries, f)
+
+
+def read_lexical_entries(path):
+    with open(os.path.join(path, LEXICAL_NAME)) as f:
+        return json.load(f)
+
+
+def lookup(entries, query):
+    """Positions of the documents matching the query exactly or through an alias, or None."""
+    key = normalize_symptom(query)
+    positions = entries.get(key) or entries.get(get_aliases().get(key, ""))
+    if positions:
+        stats["hits"] += 1
+        return positions
+    stats["misses"] += 1
+    return None
+
+
+def lexical_stats():
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "aliases": len(_aliases) if _aliases is not None else None,
+        "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+    }
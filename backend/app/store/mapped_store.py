@@ -0,0 +1,253 @@
+import os
+import json
+import mmap
+import shutil
+import threading
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+
+from .lexical import write_lexical_entries, build_lexical_entries, lookup, LEXICAL_NAME
+
+FORMAT_VERSION = 1
+
+INDEX_NAME = "index.faiss"
+DOCS_NAME = "docs.jsonl"
+OFFSETS_NAME = "offsets.npy"
+IDS_NAME = "ids.npy"
+META_NAME = "meta.json"
+
+# Append-only logs a StoreWriter keeps while an index directory is being built
+VECTORS_LOG = "vectors.f32"
+IDS_LOG = "ids.bin"
+OFFSETS_LOG = "offsets.u64"
+ID_BYTES = 64
+
+
+def mmap_flags(index_type):
+    """faiss read flags that memory-map the bulk of an index of the given type.
+
+    IVF inverted lists are mapped with IO_FLAG_MMAP. Flat and HNSW codes can
+    only be mapped by faiss builds that know IO_FLAG_MMAP_IFC.
+    """
+    if index_type == "ivfpq":
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+
+def index_type_of(index):
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivfpq"
+    return "flat"
+
+
+def read_meta(path):
+    meta_path = os.path.join(path, META_NAME)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+class MappedVectorStore:
+    """Read-only vector store whose files are memory-mapped instead of unpickled.
+
+    Layout of an index directory:
+        index.faiss   raw FAISS index, opened memory-mapped
+        docs.jsonl    one {"page_content", "metadata"} JSON object per index position
+        offsets.npy   byte offset of every line in docs.jsonl, plus the end offset
+        ids.npy       document id (row hash) of every index position
+        lexical.json  normalized symptom -> index positions, for exact-match lookups
+        meta.json     format version, dimension, row count and build manifest
+
+    Opening a store only maps these files, so startup does not grow with the
+    corpus and workers on one host share the pages through the OS page cache.
+    """
+
+    def __init__(self, path, embedding_function=None):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.meta = read_meta(path)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {path}: {self.meta.get('format_version')}")
+
+        self.index = faiss.read_index(os.path.join(path, INDEX_NAME), mmap_flags(self.meta.get("index_type", "flat")))
+        self.ids = np.load(os.path.join(path, IDS_NAME), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, OFFSETS_NAME), mmap_mode="r")
+
+        self._docs_file = open(os.path.join(path, DOCS_NAME), "rb")
+        self._docs = (
+            mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self.ids) else b""
+        )
+        # Opened now so the lexical table stays readable after this version is pruned
+        lexical_path = os.path.join(path, LEXICAL_NAME)
+        self._lexical_file = open(lexical_path, "rb") if os.path.exists(lexical_path) else None
+        self._lexical = None
+        self._lexical_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def doc_id(self, position):
+        doc_id = self.ids[position]
+        return doc_id.decode() if isinstance(doc_id, bytes) else str(doc_id)
+
+    def document(self, position):
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        record = json.loads(self._docs[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def vector(self, position):
+        return self.index.reconstruct(int(position))
+
+    @property
+    def lexical(self):
+        with self._lexical_lock:
+            if self._lexical is None:
+                if self._lexical_file is not None:
+                    self._lexical = json.load(self._lexical_file)
+                    self._lexical_file.close()
+                else:
+                    self._lexical = build_lexical_entries(self.document(p).page_content for p in range(len(self)))
+        return self._lexical
+
+    def lexical_search(self, query):
+        """[(Document, 1.0), ...] for an exact or alias symptom match, or None."""
+        positions = lookup(self.lexical, query)
+        if positions is None:
+            return None
+        return [(self.document(position), 1.0) for position in positions]
+
+    def search(self, vectors, k=3):
+        """Run one batched index search and return [(Document, score), ...] per query vector."""
+        scores, positions = self.index.search(np.asarray(vectors, dtype=np.float32), k)
+        return [
+            [
+                (self.document(int(position)), float(score))
+                for score, position in zip(row_scores, row_positions)
+                if position != -1
+            ]
+            for row_scores, row_positions in zip(scores, positions)
+        ]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=3):
+        return self.search([embedding], k)[0]
+
+    def similarity_search_by_vector(self, embedding, k=3):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query, k=3):
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+
+    def close(self):
+        if isinstance(self._docs, mmap.mmap):
+            self._docs.close()
+        self._docs_file.close()
+        if self._lexical_file is not None:
+            self._lexical_file.close()
+
+
+class StoreWriter:
+    """Builds a MappedVectorStore directory by appending rows.
+
+    Documents go straight to docs.jsonl in their final format; ids, line
+    offsets and vectors go to fixed-width append logs. Everything written
+    after the first `rows` rows is truncated on open, so a build interrupted
+    after a flush() can be resumed from that row count. finish() assembles
+    the FAISS index from the memory-mapped vector log; discard_logs() then
+    drops the logs.
+    """
+
+    def __init__(self, path, rows=0, dim=None):
+        if rows and dim is None:
+            raise ValueError("Resuming a StoreWriter needs the vector dimension")
+        self.path = path
+        self.rows = rows
+        self.dim = dim
+        if rows == 0:
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+        self._docs_size = 0
+        if rows:
+            with open(self._log(OFFSETS_LOG), "rb") as f:
+                f.seek((rows - 1) * 8)
+                self._docs_size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+
+        self._files = {}
+        for name, size in [
+            (DOCS_NAME, self._docs_size),
+            (OFFSETS_LOG, rows * 8),
+            (IDS_LOG, rows * ID_BYTES),
+            (VECTORS_LOG, rows * (dim or 0) * 4),
+        ]:
+            f = open(self._log(name), "ab")
+            f.truncate(size)
+            self._files[name] = f
+
+    def _log(self, name):
+        return os.path.join(self.path, name)
+
+    def append(self, ids, documents, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+
+        offsets = []
+        for doc in documents:
+            line = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}).encode("utf-8") + b"\n"
+            self._files[DOCS_NAME].write(line)
+            self._docs_size += len(line)
+            offsets.append(self._docs_size)
+
+        self._files[OFFSETS_LOG].write(np.array(offsets, dtype=np.uint64).tobytes())
+        self._files[IDS_LOG].write(np.array(list(ids), dtype=f"S{ID_BYTES}").tobytes())
+        self._files[VECTORS_LOG].write(vectors.tobytes())
+        self.rows += len(offsets)
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finish(self, index_factory, meta=None):
+        """Build the index from the vector log and write the read-side files."""
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+        vectors = np.memmap(self._log(VECTORS_LOG), dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        index = index_factory(vectors)
+        faiss.write_index(index, os.path.join(self.path, INDEX_NAME))
+        del vectors
+
+        offsets = np.concatenate([np.zeros(1, dtype=np.uint64), np.fromfile(self._log(OFFSETS_LOG), dtype=np.uint64)])
+        np.save(os.path.join(self.path, OFFSETS_NAME), offsets)
+        np.save(os.path.join(self.path, IDS_NAME), np.fromfile(self._log(IDS_LOG), dtype=f"S{ID_BYTES}"))
+
+        with open(self._log(DOCS_NAME), "rb") as f:
+            write_lexical_entries(self.path, build_lexical_entries(json.loads(line)["page_content"] for line in f))
+
+        with open(os.path.join(self.path, META_NAME), "w") as f:
+            json.dump({
+                "format_version": FORMAT_VERSION,
+                "dim": int(index.d),
+                "count": self.rows,
+                "index_type": index_type_of(index),
+                **(meta or {}),
+            }, f, indent=2)
+        return index
+
+    def written_ids(self):
+        return [doc_id.decode() for doc_id in np.fromfile(self._log(IDS_LOG), dtype=f"S{ID_BYTES}", count=self.rows)]
+
+    def discard_logs(self):
+        """Remove the append logs once the finished directory no longer needs them."""
+        for name in (VECTORS_LOG, IDS_LOG, OFFSETS_LOG):
+            if os.path.exists(self._log(name)):
+                os.remove(self._log(name))
+
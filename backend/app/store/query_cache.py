@@ -0,0 +1,147 @@
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_DB_TTL
+from app.db import SessionLocal
+from app.models import QueryEmbedding
+
+
+def normalize_query(text):
+    return " ".join(str(text).lower().split())
+
+def embedding_model_name(embeddings):
+    return getattr(embeddings, "provider_id", None) or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+class QueryEmbeddingCache:
+    """Two-tier cache for query embeddings.
+
+    The first tier is a per-process LRU bounded by size and TTL, the second a
+    Postgres table shared by all workers. Only a miss in both tiers reaches the
+    embedding API. Local embedders are cheaper than a cache lookup and bypass
+    it entirely.
+    """
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, db_ttl=QUERY_CACHE_DB_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.db_errors = 0
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def _put_local(self, key, vector):
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_db(self, key):
+        model, query = key
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.db_ttl)
+        try:
+            with SessionLocal() as db:
+                row = db.get(QueryEmbedding, (model, query))
+                if row is None or (row.created_at and row.created_at < cutoff):
+                    return None
+                return np.frombuffer(row.vector, dtype=np.float32)
+        except Exception as e:
+            self.db_errors += 1
+            print(f"Query embedding cache read failed: {e}")
+            return None
+
+    def _put_db(self, key, vector):
+        model, query = key
+        try:
+            with SessionLocal() as db:
+                db.execute(
+                    insert(QueryEmbedding)
+                    .values(model=model, query=query, vector=vector.tobytes(),
+                            created_at=datetime.now(timezone.utc))
+                    .on_conflict_do_update(
+                        index_elements=["model", "query"],
+                        set_={"vector": vector.tobytes(), "created_at": datetime.now(timezone.utc)},
+                    )
+                )
+                db.commit()
+        except Exception as e:
+            self.db_errors += 1
+            print(f"Query embedding cache write failed: {e}")
+
+    def get(self, text, embeddings):
+        """Return the cached vector for a query, or None on a miss in both tiers."""
+        key = (embedding_model_name(embeddings), normalize_query(text))
+        vector = self._get_local(key)
+        if vector is not None:
+            self.local_hits += 1
+            return vector
+
+        vector = self._get_db(key)
+        if vector is not None:
+            self.db_hits += 1
+            self._put_local(key, vector)
+        return vector
+
+    def put(self, text, embeddings, vector):
+        key = (embedding_model_name(embeddings), normalize_query(text))
+        vector = np.asarray(vector, dtype=np.float32)
+        self._put_local(key, vector)
+        self._put_db(key, vector)
+        return vector
+
+    def embed_query(self, text, embeddings):
+        if getattr(embeddings, "is_local", False):
+            return embeddings.embed_query(text)
+        vector = self.get(text, embeddings)
+        if vector is None:
+            self.misses += 1
+            vector = self.put(text, embeddings, embeddings.embed_query(text))
+        return vector.tolist()
+
+    def embed_queries(self, texts, embeddings):
+        """Embed several queries, sending all cache misses in one embed_documents request."""
+        if getattr(embeddings, "is_local", False):
+            return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        vectors = [self.get(text, embeddings) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            self.misses += len(missing)
+            fresh = embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = self.put(texts[i], embeddings, vector)
+        return np.stack(vectors)
+
+    def stats(self):
+        lookups = self.local_hits + self.db_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "local_hits": self.local_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "db_errors": self.db_errors,
+            "hit_ratio": (self.local_hits + self.db_hits) / lookups if lookups else 0.0,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache()
@@ -0,0 +1,213 @@
+import json
+import time
+import asyncio
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, and_, not_, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB_TTL
+from app.db import SessionLocal
+from app.models import ResponseCacheEntry
+
+
+def canonicalize(value):
+    """Normalize case and whitespace of strings and put lists in a fixed order."""
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return sorted((canonicalize(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True))
+    return value
+
+def prompt_version(prompt_fn):
+    """Hash of the prompt template source; editing the template changes every key built with it."""
+    return hashlib.sha256(inspect.getsource(prompt_fn).encode("utf-8")).hexdigest()[:16]
+
+def model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+class ResponseCache:
+    """Two-tier cache for the responses of the temperature-0 sub-agent tools.
+
+    Keys hash the tool name, model, prompt version and the canonicalized tool
+    inputs, so reordered symptoms or differently spaced answers hit the same
+    entry. Like QueryEmbeddingCache, a per-process LRU sits in front of a
+    Postgres table shared by all workers. Entries written under an older
+    prompt version are never read again and are removed by purge_stale().
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, db_ttl=RESPONSE_CACHE_DB_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self.versions = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.db_errors = 0
+        self.latency_saved = 0.0
+
+    def register(self, tool, prompt_fn):
+        """Record the current prompt version of a tool, used for keys and purge_stale()."""
+        self.versions[tool] = prompt_version(prompt_fn)
+
+    def key(self, tool, llm, inputs):
+        payload = {
+            "tool": tool,
+            "model": model_name(llm),
+            "prompt_version": self.versions[tool],
+            "inputs": canonicalize(inputs),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_db(self, key):
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.db_ttl)
+        try:
+            with SessionLocal() as db:
+                row = db.get(ResponseCacheEntry, key)
+                if row is None or (row.created_at and row.created_at < cutoff):
+                    return None
+                return row.response, row.latency_ms
+        except Exception as e:
+            self.db_errors += 1
+            print(f"Response cache read failed: {e}")
+            return None
+
+    def _put_db(self, key, tool, llm, response, latency_ms):
+        values = {
+            "response": response,
+            "latency_ms": latency_ms,
+            "model": model_name(llm),
+            "prompt_version": self.versions[tool],
+            "created_at": datetime.now(timezone.utc),
+        }
+        try:
+            with SessionLocal() as db:
+                db.execute(
+                    insert(ResponseCacheEntry)
+                    .values(key=key, tool=tool, **values)
+                    .on_conflict_do_update(index_elements=["key"], set_=values)
+                )
+                db.commit()
+        except Exception as e:
+            self.db_errors += 1
+            print(f"Response cache write failed: {e}")
+
+    def _hit(self, entry):
+        response, latency_ms = entry
+        self.latency_saved += latency_ms / 1000
+        return response
+
+    def call(self, tool, prompt_fn, llm, **inputs):
+        """Return llm.invoke(prompt_fn(**inputs)).content, from the cache when possible."""
+        key = self.key(tool, llm, inputs)
+        entry = self._get_local(key)
+        if entry is not None:
+            self.local_hits += 1
+            return self._hit(entry)
+        entry = self._get_db(key)
+        if entry is not None:
+            self.db_hits += 1
+            self._put_local(key, entry)
+            return self._hit(entry)
+
+        self.misses += 1
+        start = time.perf_counter()
+        response = llm.invoke(prompt_fn(**inputs)).content
+        latency_ms = (time.perf_counter() - start) * 1000
+        self._put_local(key, (response, latency_ms))
+        self._put_db(key, tool, llm, response, latency_ms)
+        return response
+
+    async def acall(self, tool, prompt_fn, llm, **inputs):
+        """Async call(); the Postgres tier runs in a thread."""
+        key = self.key(tool, llm, inputs)
+        entry = self._get_local(key)
+        if entry is not None:
+            self.local_hits += 1
+            return self._hit(entry)
+        entry = await asyncio.to_thread(self._get_db, key)
+        if entry is not None:
+            self.db_hits += 1
+            self._put_local(key, entry)
+            return self._hit(entry)
+
+        self.misses += 1
+        start = time.perf_counter()
+        response = (await llm.ainvoke(prompt_fn(**inputs))).content
+        latency_ms = (time.perf_counter() - start) * 1000
+        self._put_local(key, (response, latency_ms))
+        await asyncio.to_thread(self._put_db, key, tool, llm, response, latency_ms)
+        return response
+
+    def invalidate(self, tool=None):
+        """Drop every entry, or those of one tool, from both tiers. Returns the rows deleted."""
+        with self._lock:
+            self._entries.clear()
+        with SessionLocal() as db:
+            statement = delete(ResponseCacheEntry)
+            if tool is not None:
+                statement = statement.where(ResponseCacheEntry.tool == tool)
+            deleted = db.execute(statement).rowcount
+            db.commit()
+        return deleted
+
+    def purge_stale(self):
+        """Delete Postgres entries written under another prompt version, or past the TTL."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.db_ttl)
+        current = [
+            and_(ResponseCacheEntry.tool == tool, ResponseCacheEntry.prompt_version == version)
+            for tool, version in self.versions.items()
+        ]
+        with SessionLocal() as db:
+            deleted = db.execute(
+                delete(ResponseCacheEntry).where(
+                    or_(not_(or_(*current)), ResponseCacheEntry.created_at < cutoff)
+                )
+            ).rowcount
+            db.commit()
+        return deleted
+
+    def stats(self):
+        lookups = self.local_hits + self.db_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "local_hits": self.local_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "db_errors": self.db_errors,
+            "hit_ratio": (self.local_hits + self.db_hits) / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "prompt_versions": self.versions,
+        }
+
+
+response_cache = ResponseCache()
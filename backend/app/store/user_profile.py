@@ -0,0 +1,145 @@
+import json
+import threading
+from uuid import uuid4
+from collections import OrderedDict
+
+from app.config import PROFILE_CACHE_SIZE
+
+NAMESPACE = "user_profile"
+KEY = "user_details"
+# Changed by every ProfileService.put(), so each worker can tell its cached copy is stale
+VERSION_KEY = "version"
+
+
+def format_profile(profile):
+    """The profile as the prompt fragment the supervisor and the memory writer show the LLM."""
+    if not profile:
+        return None
+    # Profiles written before the field was renamed use known_medical_conditions
+    conditions = profile.get("conditions") or profile.get("known_medical_conditions") or []
+    return (
+        f"Name: {profile.get('user_name', 'Unknown')}\n"
+        f"Known Medical Conditions: {', '.join(conditions) or 'None'}\n"
+        f"Age: {profile.get('age', 'Unknown')}\n"
+        f"Gender: {profile.get('gender', 'Unknown')}\n"
+    )
+
+
+def item_version(item):
+    return item.value.get("version") if item is not None and item.value else None
+
+
+def profile_value(item):
+    """The stored profile dict; older writes stored it as a JSON string."""
+    if item is None or not item.value:
+        return None
+    if isinstance(item.value, str):
+        return json.loads(item.value)
+    return item.value
+
+
+class ProfileService:
+    """Reads and writes user profiles in the LangGraph store.
+
+    Every put() also writes a new random version to a small "version" item
+    next to the profile. Each worker keeps an LRU of profiles with their
+    formatted prompt fragment and the version they were read at; a read
+    fetches only the shared version and re-reads the profile when it
+    changed, so a profile written by any worker is served everywhere at
+    once. put() compares against a fresh read of the store, never the cache.
+    """
+
+    def __init__(self, maxsize=PROFILE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.unchanged_writes = 0
+
+    def _get_local(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry["version"] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def _put_local(self, user_id, profile, version):
+        entry = {"profile": profile, "formatted": format_profile(profile), "version": version}
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _entry(self, store, user_id):
+        version = item_version(store.get((NAMESPACE, user_id), VERSION_KEY))
+        entry = self._get_local(user_id, version)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return self._put_local(user_id, profile_value(store.get((NAMESPACE, user_id), KEY)), version)
+
+    async def _aentry(self, store, user_id):
+        version = item_version(await store.aget((NAMESPACE, user_id), VERSION_KEY))
+        entry = self._get_local(user_id, version)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return self._put_local(user_id, profile_value(await store.aget((NAMESPACE, user_id), KEY)), version)
+
+    def get(self, store, user_id):
+        """The profile dict of a user, or None."""
+        return self._entry(store, user_id)["profile"]
+
+    async def aget(self, store, user_id):
+        return (await self._aentry(store, user_id))["profile"]
+
+    def formatted(self, store, user_id):
+        """The profile prompt fragment of a user, or None."""
+        return self._entry(store, user_id)["formatted"]
+
+    async def aformatted(self, store, user_id):
+        return (await self._aentry(store, user_id))["formatted"]
+
+    def put(self, store, user_id, profile):
+        """Store a profile dict and bump its version. Returns False when the stored profile is the same."""
+        if profile == profile_value(store.get((NAMESPACE, user_id), KEY)):
+            self.unchanged_writes += 1
+            return False
+        version = uuid4().hex
+        store.put((NAMESPACE, user_id), KEY, profile)
+        store.put((NAMESPACE, user_id), VERSION_KEY, {"version": version})
+        self.writes += 1
+        self._put_local(user_id, profile, version)
+        return True
+
+    async def aput(self, store, user_id, profile):
+        if profile == profile_value(await store.aget((NAMESPACE, user_id), KEY)):
+            self.unchanged_writes += 1
+            return False
+        version = uuid4().hex
+        await store.aput((NAMESPACE, user_id), KEY, profile)
+        await store.aput((NAMESPACE, user_id), VERSION_KEY, {"version": version})
+        self.writes += 1
+        self._put_local(user_id, profile, version)
+        return True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "unchanged_writes": self.unchanged_writes,
+        }
+
+
+profile_service = ProfileService()
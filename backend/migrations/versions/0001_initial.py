@@ -0,0 +1,79 @@
+"""Initial schema
+
+The tables used to be created by Base.metadata.create_all when app.main was
+imported, so existing databases already have some or all of them. Only the
+missing tables are created; running this against such a database simply
+brings it under Alembic.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op, context
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Offline (--sql) runs cannot inspect the database and emit every table
+    existing = set() if context.is_offline_mode() else set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "chats" not in existing:
+        op.create_table(
+            "chats",
+            sa.Column("chat_id", sa.String(), primary_key=True),
+            sa.Column("user_id", sa.String()),
+            sa.Column("is_public", sa.Boolean()),
+            sa.Column("chat_name", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_chats_chat_id", "chats", ["chat_id"])
+        op.create_index("ix_chats_user_id", "chats", ["user_id"])
+
+    if "query_embeddings" not in existing:
+        op.create_table(
+            "query_embeddings",
+            sa.Column("model", sa.String(), primary_key=True),
+            sa.Column("query", sa.String(), primary_key=True),
+            sa.Column("vector", sa.LargeBinary(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    if "response_cache" not in existing:
+        op.create_table(
+            "response_cache",
+            sa.Column("key", sa.String(64), primary_key=True),
+            sa.Column("tool", sa.String(), nullable=False),
+            sa.Column("model", sa.String(), nullable=False),
+            sa.Column("prompt_version", sa.String(), nullable=False),
+            sa.Column("response", sa.Text(), nullable=False),
+            sa.Column("latency_ms", sa.Float(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_response_cache_tool", "response_cache", ["tool"])
+
+    if "chat_messages" not in existing:
+        op.create_table(
+            "chat_messages",
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column("chat_id", sa.String(), sa.ForeignKey("chats.chat_id", ondelete="CASCADE"), nullable=False),
+            sa.Column("message_id", sa.String(), nullable=False),
+            sa.Column("role", sa.String(), nullable=False),
+            sa.Column("content", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("chat_id", "message_id", name="uq_chat_messages_chat_message"),
+        )
+        op.create_index("ix_chat_messages_chat_id_id", "chat_messages", ["chat_id", "id"])
+
+
+def downgrade():
+    op.drop_table("chat_messages")
+    op.drop_table("response_cache")
+    op.drop_table("query_embeddings")
+    op.drop_table("chats")
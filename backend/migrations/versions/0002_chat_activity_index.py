@@ -0,0 +1,29 @@
+"""Order chats by activity
+
+Backfills chats.updated_at, which used to be set only at creation, gives it
+a server default and adds the (user_id, updated_at) index the chat list is
+paginated on.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("UPDATE chats SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL")
+    op.alter_column("chats", "updated_at", server_default=sa.func.now())
+    op.execute("CREATE INDEX IF NOT EXISTS ix_chats_user_id_updated_at ON chats (user_id, updated_at)")
+
+
+def downgrade():
+    op.drop_index("ix_chats_user_id_updated_at", table_name="chats")
+    op.alter_column("chats", "updated_at", server_default=None)
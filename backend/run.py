@@ -1,4 +1,8 @@
 import uvicorn
+from alembic import command
+from alembic.config import Config
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # The app does not create its tables; bring the schema up to date first
+    command.upgrade(Config("alembic.ini"), "head")
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)